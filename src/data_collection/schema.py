@@ -47,6 +47,7 @@ ROBOTS_SCRAPE_SCHEMA = {
     "scraped_url": "str",
     "robots_txt": "str",                  # cleaned robots.txt content
     "raw_robots_response_text": "str",    # raw HTTP response body
+    "robots_hash": "str",                 # SHA-256 of the raw body
     "robots_content_type": "str",
     "robots_rules": "dict_or_str",        # parsed rules, e.g. JSON-like
     "meta_robots": "str",
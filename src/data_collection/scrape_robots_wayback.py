@@ -7,8 +7,32 @@ for analyzing how sites restrict or permit search engine crawling over time.
 This script:
 - Queries the Wayback Machine CDX API for snapshots of robots.txt files
 - Downloads and parses robots.txt content
-- Extracts meta robots tags and X-Robots-Tag headers from homepages
-- Handles rate limiting, checkpointing, and error recovery for large-scale scraping
+- Extracts meta robots tags and X-Robots-Tag headers from homepages, reading
+  only up to the end of each homepage's <head> (or only headers)
+- Handles token-bucket rate limiting with adaptive backoff, checkpointing,
+  and error recovery for large-scale scraping
+- Re-fetches snapshots that failed transiently at the end of a batch
+- Optionally scrapes many domains concurrently under a global request budget
+- Offers asyncio variants that overlap many snapshot downloads at once
+- Reuses keep-alive connections to the archive through a pooled HTTP session
+- Caches immutable snapshot downloads on disk (with an offline mode)
+- Caches CDX results per URL and only queries uncovered date ranges
+- Batches CDX lookups of related domains into paged, streamed bulk queries
+- Walks complete CDX histories page by page, resumable after a crash
+- Downloads each distinct homepage capture only once per domain
+- Optionally downloads one robots.txt body per distinct CDX digest
+- Collects a selectable subset of signals, skipping unneeded fetches
+- Splits large domain lists into hash-based shards run in separate processes
+- Journals every written snapshot so resumed runs skip exactly those
+- Tracks finished domains by identity, so a grown domain list only scrapes
+  new ones
+- Normalizes, validates and deduplicates the input domain list in bulk
+- Writes output as CSV, as compressed, column-selectable Parquet parts, or
+  into an indexed SQLite database
+- Optionally stores each distinct robots.txt body once, keyed by its hash
+- Optionally archives raw responses in a seekable, indexed WARC file
+- Commits output and progress together, so resumed runs neither lose nor
+  duplicate rows
 
 Output schema matches ROBOTS_SCRAPE_SCHEMA defined in schema.py.
 
@@ -17,298 +41,3113 @@ Research context: AI Overviews impact study with Prof. Maximilian Schäfer, IMT
 """
 
 import os
+import asyncio
+import functools
+import itertools
+import bisect
 import requests
 from bs4 import BeautifulSoup
 import time
 import pandas as pd
 import random
 import json
+import re
+import codecs
+import hashlib
+import gzip
+import shutil
+import sqlite3
+import threading
+import uuid
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
 from requests.exceptions import Timeout, ConnectionError, RequestException
 
+try:
+    from .schema import ROBOTS_SCRAPE_SCHEMA
+except ImportError:     # run as a script
+    from schema import ROBOTS_SCRAPE_SCHEMA
+
+
+###############################################################################
+# UTILITIES
+###############################################################################
+
+def ensure_dir_exists(path):
+    """Create directory if it doesn't exist."""
+    if not os.path.exists(path):
+        os.makedirs(path, exist_ok=True)
+
+
+###############################################################################
+# GLOBAL RATE LIMITING
+###############################################################################
+
+# Request budgets toward web.archive.org, shared by all worker threads.
+# CDX queries and snapshot downloads hit different endpoints and get
+# separate buckets; bursts let a robots.txt/homepage pair go out together.
+DEFAULT_CDX_RATE = 0.5          # CDX queries per second
+DEFAULT_CDX_BURST = 1
+DEFAULT_SNAPSHOT_RATE = 1.0     # snapshot downloads per second
+DEFAULT_SNAPSHOT_BURST = 2
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket.
+
+    Tokens refill continuously at ``rate`` per second up to ``capacity``.
+    A caller that finds the bucket empty reserves the next token and sleeps
+    only until it becomes available, so no time is spent idle while budget
+    remains.
+    """
+
+    def __init__(self, rate, capacity=1):
+        self._lock = threading.Lock()
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self.set_rate(rate, capacity)
+
+    def _refill(self, now):
+        elapsed = now - self._updated
+        self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+        self._updated = now
+
+    def set_rate(self, rate, capacity=None):
+        """Change the refill rate (tokens per second, > 0) and the capacity."""
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        with self._lock:
+            if hasattr(self, 'rate'):
+                self._refill(time.monotonic())
+            self.rate = float(rate)
+            if capacity is not None:
+                if capacity < 1:
+                    raise ValueError("capacity must be at least 1")
+                self.capacity = float(capacity)
+                self._tokens = min(self._tokens, self.capacity)
+
+    def acquire(self):
+        """Take one token, blocking until one is available."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._tokens -= 1
+            delay = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if delay > 0:
+            time.sleep(delay)
+
+    def pause(self, seconds):
+        """Hold back all further tokens for at least ``seconds``."""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens = min(self._tokens, 0.0) - seconds * self.rate
+
+
+###############################################################################
+# ADAPTIVE BACKOFF
+###############################################################################
+
+# Responses signalling that the archive wants us to slow down
+THROTTLE_STATUS_CODES = (429, 503)
+MAX_THROTTLE_RETRIES = 4
+
+# AIMD bounds, relative to the configured rate of each bucket
+RATE_INCREASE_FRACTION = 0.02   # share of the configured rate added per healthy response
+RATE_DECREASE_FACTOR = 0.5      # rate multiplier on each throttled response
+RATE_FLOOR_FACTOR = 0.05
+RATE_CEILING_FACTOR = 3.0
+
+# Exponential backoff used when no Retry-After header is given
+BACKOFF_BASE = 2.0
+BACKOFF_CAP = 120.0
+
+
+class AdaptiveRateController:
+    """
+    AIMD congestion control of a TokenBucket driven by archive responses.
+
+    Healthy responses raise the bucket rate additively, by
+    RATE_INCREASE_FRACTION of the configured rate, probing up to
+    ``ceiling_factor`` (RATE_CEILING_FACTOR by default) times the configured
+    rate. A 429/503 halves it and pauses the whole bucket, for Retry-After
+    seconds when the archive sends one, otherwise for an exponentially
+    growing, jittered backoff.
+    """
+
+    def __init__(self, bucket):
+        self.bucket = bucket
+        self._lock = threading.Lock()
+        self._consecutive_throttles = 0
+        self.reset(bucket.rate)
+
+    def reset(self, base_rate, capacity=None, ceiling_factor=None):
+        """Restart control around a newly configured base rate."""
+        if ceiling_factor is None:
+            ceiling_factor = RATE_CEILING_FACTOR
+        self.bucket.set_rate(base_rate, capacity)
+        with self._lock:
+            self.base_rate = base_rate
+            self.min_rate = base_rate * RATE_FLOOR_FACTOR
+            self.max_rate = base_rate * ceiling_factor
+            self._consecutive_throttles = 0
+
+    def on_success(self):
+        """Additive increase after a healthy response."""
+        with self._lock:
+            self._consecutive_throttles = 0
+            new_rate = min(self.max_rate,
+                           self.bucket.rate + self.base_rate * RATE_INCREASE_FRACTION)
+        self.bucket.set_rate(new_rate)
+
+    def on_throttled(self, retry_after=None):
+        """
+        Multiplicative decrease and pause after a 429/503.
+
+        Args:
+            retry_after: Seconds requested by the archive, if any
+
+        Returns:
+            Seconds the bucket is paused for
+        """
+        with self._lock:
+            self._consecutive_throttles += 1
+            attempt = self._consecutive_throttles
+            new_rate = max(self.min_rate, self.bucket.rate * RATE_DECREASE_FACTOR)
+        self.bucket.set_rate(new_rate)
+
+        if retry_after is not None:
+            delay = retry_after
+        else:
+            backoff = min(BACKOFF_CAP, BACKOFF_BASE * 2 ** (attempt - 1))
+            delay = backoff / 2 + random.uniform(0, backoff / 2)
+
+        self.bucket.pause(delay)
+        return delay
+
+
+def parse_retry_after(value):
+    """
+    Parse a Retry-After header (delta-seconds or HTTP date).
+
+    Returns:
+        Seconds to wait (>= 0), or None if absent or malformed
+    """
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+_rate_limits = {
+    'cdx': AdaptiveRateController(TokenBucket(DEFAULT_CDX_RATE, DEFAULT_CDX_BURST)),
+    'snapshot': AdaptiveRateController(TokenBucket(DEFAULT_SNAPSHOT_RATE,
+                                                   DEFAULT_SNAPSHOT_BURST)),
+}
+
+
+def set_rate_limits(cdx_rate=None, snapshot_rate=None,
+                    cdx_burst=None, snapshot_burst=None, ceiling_factor=None):
+    """
+    Configure the global request budgets toward web.archive.org.
+
+    The rates are starting points: adaptive backoff lowers them when the
+    archive throttles and probes back up while responses stay healthy, to
+    at most ``ceiling_factor`` times the configured rate.
+
+    Args:
+        cdx_rate: CDX API queries per second
+        snapshot_rate: Snapshot downloads per second
+        cdx_burst: Maximum CDX queries issued back to back
+        snapshot_burst: Maximum snapshot downloads issued back to back
+        ceiling_factor: Highest rate probed, as a multiple of the configured
+            rate (RATE_CEILING_FACTOR if None; 1 never exceeds it)
+    """
+    if cdx_rate is not None or cdx_burst is not None or ceiling_factor is not None:
+        controller = _rate_limits['cdx']
+        controller.reset(cdx_rate or controller.base_rate, cdx_burst, ceiling_factor)
+    if snapshot_rate is not None or snapshot_burst is not None or ceiling_factor is not None:
+        controller = _rate_limits['snapshot']
+        controller.reset(snapshot_rate or controller.base_rate, snapshot_burst,
+                         ceiling_factor)
+
+
+###############################################################################
+# HTTP SESSION
+###############################################################################
+
+# Keep-alive connections held open to web.archive.org per session
+DEFAULT_POOL_SIZE = 10
+
+_shared_session = None
+_shared_session_lock = threading.Lock()
+
+
+def create_session(pool_size=DEFAULT_POOL_SIZE):
+    """
+    Create a requests.Session with a keep-alive connection pool.
+
+    Up to ``pool_size`` connections are kept open and reused, so consecutive
+    snapshots skip the TCP and TLS handshake. Threads beyond the pool size
+    wait for a free connection instead of opening throwaway ones.
+
+    Args:
+        pool_size: Maximum number of pooled connections per host
+
+    Returns:
+        requests.Session
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_size,
+                          pool_block=True)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def get_shared_session():
+    """Module-wide pooled session used when no session is passed explicitly."""
+    global _shared_session
+    with _shared_session_lock:
+        if _shared_session is None:
+            _shared_session = create_session()
+        return _shared_session
+
+
+def _archive_get(url, kind, session=None, method='GET', **kwargs):
+    """
+    Issue a GET (or ``method``) to the archive once the ``kind`` budget
+    allows it.
+
+    Throttled responses (429/503) are retried up to MAX_THROTTLE_RETRIES
+    times after backing off; the last response is returned if the archive
+    keeps refusing.
+    """
+    controller = _rate_limits[kind]
+    session = session or get_shared_session()
+
+    for attempt in range(MAX_THROTTLE_RETRIES + 1):
+        controller.bucket.acquire()
+        resp = session.request(method, url, **kwargs)
+
+        if resp.status_code not in THROTTLE_STATUS_CODES:
+            if resp.status_code < 500:
+                controller.on_success()
+            return resp
+
+        delay = controller.on_throttled(
+            parse_retry_after(resp.headers.get('Retry-After'))
+        )
+        if attempt < MAX_THROTTLE_RETRIES:
+            print(f"  HTTP {resp.status_code} from archive, backing off {delay:.1f}s")
+            resp.close()
+
+    return resp
+
+
+###############################################################################
+# SNAPSHOT CACHE
+###############################################################################
+
+DEFAULT_CACHE_MAX_BYTES = 5 * 1024 ** 3
+
+
+class SnapshotCacheMiss(RequestException):
+    """Raised in offline mode when a snapshot is not in the cache."""
+
+
+class SnapshotCache:
+    """
+    On-disk cache of Wayback ``id_`` snapshot responses.
+
+    A snapshot at a given (url, timestamp) never changes, so responses are
+    stored under the SHA-256 of their archive URL and reused across runs.
+    Each entry is a body file plus a small JSON metadata file. Hits refresh
+    the entry's mtime, and once the cache exceeds ``max_bytes`` the least
+    recently used entries are evicted down to 90% of the limit.
+
+    With ``offline=True`` nothing is fetched: misses raise SnapshotCacheMiss.
+    """
+
+    def __init__(self, directory, max_bytes=DEFAULT_CACHE_MAX_BYTES, offline=False):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.offline = offline
+        self._lock = threading.Lock()
+        ensure_dir_exists(directory)
+        self._total_bytes = sum(size for _, _, size in self._scan())
+
+    def _paths(self, archive_url):
+        key = hashlib.sha256(archive_url.encode('utf-8')).hexdigest()
+        subdir = os.path.join(self.directory, key[:2])
+        return subdir, os.path.join(subdir, key + '.body'), os.path.join(subdir, key + '.json')
+
+    def _scan(self):
+        """Yield (meta_path, mtime, entry_size) for every cached entry."""
+        for subdir in os.scandir(self.directory):
+            if not subdir.is_dir():
+                continue
+            for entry in os.scandir(subdir.path):
+                if not entry.name.endswith('.json'):
+                    continue
+                body_path = entry.path[:-len('.json')] + '.body'
+                try:
+                    stat = entry.stat()
+                    size = stat.st_size + os.path.getsize(body_path)
+                except OSError:
+                    continue
+                yield entry.path, stat.st_mtime, size
+
+    def get(self, archive_url):
+        """Cached requests.Response for archive_url, or None."""
+        _, body_path, meta_path = self._paths(archive_url)
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            with open(body_path, 'rb') as f:
+                body = f.read()
+            os.utime(meta_path)
+        except (OSError, ValueError):
+            return None
+
+        resp = requests.Response()
+        resp.status_code = meta['status_code']
+        resp.headers = CaseInsensitiveDict(meta['headers'])
+        resp.encoding = meta['encoding']
+        resp.url = meta['url']
+        resp._content = body
+        return resp
+
+    def get_first(self, *archive_urls):
+        """
+        Cached response for the first of several keys that has one, or None.
+
+        Responses are falsy for error statuses, so hits are tested with
+        ``is not None`` to keep cached 4xx answers.
+        """
+        for archive_url in archive_urls:
+            cached = self.get(archive_url)
+            if cached is not None:
+                return cached
+        return None
+
+    def put(self, archive_url, resp):
+        """Store a response; the body file is written before its metadata."""
+        subdir, body_path, meta_path = self._paths(archive_url)
+        ensure_dir_exists(subdir)
+        meta = json.dumps({
+            'archive_url': archive_url,
+            'url': resp.url,
+            'status_code': resp.status_code,
+            'headers': dict(resp.headers),
+            'encoding': resp.encoding,
+        })
+
+        for path, data, mode in ((body_path, resp.content, 'wb'),
+                                 (meta_path, meta.encode('utf-8'), 'wb')):
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, mode) as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+
+        with self._lock:
+            self._total_bytes += len(resp.content) + len(meta)
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """Drop least recently used entries down to 90% of max_bytes."""
+        entries = sorted(self._scan(), key=lambda entry: entry[1])
+        total = sum(size for _, _, size in entries)
+        target = 0.9 * self.max_bytes
+
+        for meta_path, _, size in entries:
+            if total <= target:
+                break
+            for path in (meta_path, meta_path[:-len('.json')] + '.body'):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            total -= size
+
+        self._total_bytes = total
+
+
+_snapshot_cache = None
+
+
+def set_snapshot_cache(cache):
+    """Use ``cache`` (a SnapshotCache, or None to disable) for all downloads."""
+    global _snapshot_cache
+    _snapshot_cache = cache
+
+
+###############################################################################
+# RESPONSE ARCHIVE
+###############################################################################
+
+# Headers that describe the transfer rather than the (already decoded) body
+_TRANSFER_HEADERS = frozenset({'content-encoding', 'transfer-encoding', 'content-length'})
+
+
+class ResponseArchive:
+    """
+    Append-only WARC archive of the raw responses a scrape downloads.
+
+    Each response is written as one gzip-compressed WARC ``response`` record
+    (status line, headers and body) to ``path``, and its offset and length
+    in the file are appended to the ``path + '.idx'`` JSON-lines index.
+    Every record is its own gzip member, so ``get`` decompresses just that
+    record, and standard WARC tools can read the file as a whole.
+
+    Records are keyed by the original URL and the timestamp it was requested
+    at; a later record for the same key supersedes the earlier one. Bodies
+    that were only partly downloaded (homepage heads, header-only fetches)
+    carry ``WARC-Truncated: length``. On open, bytes past the last indexed
+    record (a crash mid-write) are cut off.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.index_path = path + '.idx'
+        self._lock = threading.Lock()
+        self._index = {}
+        end = 0
+        for line in _load_log_lines(self.index_path):
+            entry = json.loads(line)
+            self._index[(entry['url'], entry['timestamp'])] = (entry['offset'],
+                                                               entry['length'])
+            end = max(end, entry['offset'] + entry['length'])
+        if os.path.exists(path) and os.path.getsize(path) > end:
+            os.truncate(path, end)
+        self._data = open(path, 'ab')
+        self._index_file = open(self.index_path, 'a', encoding='utf-8')
+
+    def __contains__(self, key):
+        return tuple(key) in self._index
+
+    def __len__(self):
+        return len(self._index)
+
+    @staticmethod
+    def _record(url, timestamp, resp, truncated):
+        reason = resp.reason or ''
+        lines = [f"HTTP/1.1 {resp.status_code} {reason}".rstrip()]
+        lines += [f"{name}: {value}" for name, value in resp.headers.items()
+                  if name.lower() not in _TRANSFER_HEADERS]
+        lines.append(f"Content-Length: {len(resp.content)}")
+        block = ('\r\n'.join(lines) + '\r\n\r\n').encode('utf-8') + resp.content
+
+        warc_date = _parse_wayback_timestamp(timestamp).strftime('%Y-%m-%dT%H:%M:%SZ')
+        headers = [
+            "WARC/1.0",
+            "WARC-Type: response",
+            f"WARC-Record-ID: <urn:uuid:{uuid.uuid4()}>",
+            f"WARC-Date: {warc_date}",
+            f"WARC-Target-URI: {url}",
+            f"WARC-Source-URI: {resp.url or url}",
+            "Content-Type: application/http; msgtype=response",
+            f"Content-Length: {len(block)}",
+        ]
+        if truncated:
+            headers.append("WARC-Truncated: length")
+        record = ('\r\n'.join(headers) + '\r\n\r\n').encode('utf-8') + block + b'\r\n\r\n'
+        return gzip.compress(record)
+
+    def write(self, url, timestamp, resp, truncated=False):
+        """Append one response requested for (url, timestamp)."""
+        data = self._record(url, timestamp, resp, truncated)
+        with self._lock:
+            offset = self._data.tell()
+            self._data.write(data)
+            self._data.flush()
+            os.fsync(self._data.fileno())
+            _append_log_line(self._index_file, json.dumps({
+                'url': url, 'timestamp': timestamp,
+                'offset': offset, 'length': len(data)
+            }))
+            self._index[(url, timestamp)] = (offset, len(data))
+
+    def get(self, url, timestamp):
+        """
+        Archived response for (url, timestamp) as a requests.Response.
+
+        Raises:
+            KeyError: if no response was archived for the key
+        """
+        offset, length = self._index[(url, timestamp)]
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            record = gzip.decompress(f.read(length))
+
+        warc_headers, block = record.split(b'\r\n\r\n', 1)
+        http_headers, rest = block.split(b'\r\n\r\n', 1)
+        status_line, *header_lines = http_headers.decode('utf-8').split('\r\n')
+        warc = dict(line.split(': ', 1) for line in warc_headers.decode('utf-8').split('\r\n')[1:])
+        body_length = int(warc['Content-Length']) - len(http_headers) - 4
+
+        resp = requests.Response()
+        resp.status_code = int(status_line.split(' ')[1])
+        resp.reason = status_line.split(' ', 2)[2] if status_line.count(' ') > 1 else ''
+        resp.headers = CaseInsensitiveDict(line.split(': ', 1) for line in header_lines)
+        resp.encoding = requests.utils.get_encoding_from_headers(resp.headers)
+        resp.url = warc['WARC-Source-URI']
+        resp._content = rest[:body_length]
+        return resp
+
+    def close(self):
+        self._data.close()
+        self._index_file.close()
+
+
+###############################################################################
+# CDX INDEX CACHE
+###############################################################################
+
+# Padding that turns a timestamp prefix (e.g. '2024') into the first or last
+# 14-digit timestamp it stands for; 14-digit strings then compare correctly
+_TS_LOWER_PAD = '00000101000000'
+_TS_UPPER_PAD = '99991231235959'
+
+# Captures can show up in the CDX index well after their timestamp, so the
+# most recent part of a queried window is never recorded as complete
+CDX_INGEST_MARGIN_DAYS = 30
+
+
+def _window_bound(timestamp, upper):
+    """Normalize a CDX from/to value into a comparable 14-digit string."""
+    if not timestamp:
+        return '9' * 14 if upper else '0' * 14
+    digits = str(timestamp)[:14]
+    pad = _TS_UPPER_PAD if upper else _TS_LOWER_PAD
+    return digits + pad[len(digits):]
+
+
+def _coverage_cutoff():
+    """Latest timestamp a CDX answer received now can count as complete for."""
+    cutoff = datetime.now(timezone.utc) - timedelta(days=CDX_INGEST_MARGIN_DAYS)
+    return cutoff.strftime('%Y%m%d%H%M%S')
+
+
+def _add_coverage(entry, start, end, cutoff):
+    """Record that [start, end] was queried; complete only up to ``cutoff``."""
+    entry['queried'] = _merge_ranges(entry.get('queried', []) + [[start, end]])
+    end = min(end, cutoff)
+    if start <= end:
+        entry['ranges'] = _merge_ranges(entry['ranges'] + [[start, end]])
+
+
+def _merge_ranges(ranges):
+    """Merge overlapping or touching [start, end] timestamp ranges."""
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def _first_gap(ranges, lo, hi):
+    """First [start, end] part of the window [lo, hi] not covered by ranges."""
+    cursor = lo
+    for start, end in ranges:
+        if end < cursor:
+            continue
+        if start > cursor:
+            return cursor, min(start, hi)
+        if end >= hi:
+            return None
+        cursor = end
+    return cursor, hi
+
+
+def _sort_snapshots(snapshots):
+    """Snapshots in timestamp order."""
+    return sorted(snapshots, key=lambda s: s['timestamp'])
+
+
+def _collapse_daily(snapshots):
+    """Sort snapshots and keep the first per day, like collapse=timestamp:8."""
+    seen_days = set()
+    collapsed = []
+    for snap in sorted(snapshots, key=lambda s: s['timestamp']):
+        day = snap['timestamp'][:8]
+        if day not in seen_days:
+            seen_days.add(day)
+            collapsed.append(snap)
+    return collapsed
+
+
+class CdxIndexCache:
+    """
+    Persistent per-URL cache of CDX results with coverage tracking.
+
+    For every URL the cache keeps the snapshots seen so far and the
+    timestamp ranges that are known to be complete. A lookup only queries
+    the uncovered sub-ranges of the requested window and merges the answers
+    into the cached list, so extending a study window pays only for the new
+    dates. With ``limit`` the walk stops as soon as enough snapshots are
+    known from the start of the window. The last CDX_INGEST_MARGIN_DAYS
+    before a query are not recorded as complete, so captures the archive
+    indexes late are picked up by later lookups.
+
+    Lookups with ``collapse_daily=False`` keep every capture and are cached
+    separately from the daily-collapsed ones.
+
+    With ``offline=True`` uncovered ranges are never queried: a lookup that
+    would need one raises CdxCacheMiss. Ranges queried before count as
+    covered there, recent ones included.
+    """
+
+    def __init__(self, directory, offline=False):
+        self.directory = directory
+        self.offline = offline
+        self._lock = threading.Lock()
+        self._url_locks = {}
+        ensure_dir_exists(directory)
+
+    def _path(self, url, collapse_daily=True):
+        name = url if collapse_daily else f"{url}\tall-captures"
+        key = hashlib.sha256(name.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, key[:2], key + '.json')
+
+    def _load(self, url, collapse_daily=True):
+        try:
+            with open(self._path(url, collapse_daily), 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return {'url': url, 'ranges': [], 'snapshots': {}}
+        return entry
+
+    def _save(self, url, entry, collapse_daily=True):
+        path = self._path(url, collapse_daily)
+        ensure_dir_exists(os.path.dirname(path))
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, path)
+
+    def lookup(self, url, from_timestamp, to_timestamp, limit, fetch,
+               collapse_daily=True):
+        """
+        Snapshots of ``url`` in the window, querying only what is missing.
+
+        Args:
+            url: URL as passed to the CDX API
+            from_timestamp, to_timestamp, limit: As in get_cdx_snapshots
+            fetch: Callable(limit=, from_timestamp=, to_timestamp=) running a
+                single CDX query; its exceptions propagate and leave the
+                cache unchanged for the failed range
+            collapse_daily: Whether ``fetch`` keeps only the first snapshot
+                of each day; False caches and returns every capture
+
+        Returns:
+            List of snapshot dictionaries, as from get_cdx_snapshots
+        """
+        lo = _window_bound(from_timestamp, upper=False)
+        hi = _window_bound(to_timestamp, upper=True)
+
+        with self._lock:
+            url_lock = self._url_locks.setdefault(url, threading.Lock())
+
+        select = _collapse_daily if collapse_daily else _sort_snapshots
+
+        cutoff = _coverage_cutoff()
+
+        with url_lock:
+            entry = self._load(url, collapse_daily)
+            # Ranges this lookup needs no query for; unlike entry['ranges'] it
+            # includes the recent parts queried before (offline) or just now
+            answered = entry['ranges']
+            if self.offline:
+                answered = _merge_ranges(answered + entry.get('queried', []))
+            changed = False
+            try:
+                while True:
+                    gap = _first_gap(answered, lo, hi)
+                    if gap is None:
+                        break
+                    gap_from, gap_to = gap
+
+                    request_limit = None
+                    if limit:
+                        known = select(
+                            s for ts, s in entry['snapshots'].items() if lo <= ts < gap_from
+                        )
+                        if len(known) >= limit:
+                            break
+                        # One extra: the gap query may return the snapshot at gap_from again
+                        request_limit = limit - len(known) + 1
+                    if self.offline:
+                        raise CdxCacheMiss(f"Not in offline CDX cache: {url} "
+                                           f"from {gap_from} to {gap_to}")
+
+                    results = fetch(
+                        limit=request_limit,
+                        from_timestamp=from_timestamp if gap_from == lo else gap_from,
+                        to_timestamp=to_timestamp if gap_to == hi else gap_to
+                    )
+                    for snap in results:
+                        entry['snapshots'][snap['timestamp']] = snap
+
+                    covered_to = gap_to
+                    if request_limit and len(results) >= request_limit:
+                        covered_to = max(snap['timestamp'] for snap in results)
+                    answered = _merge_ranges(answered + [[gap_from, covered_to]])
+                    _add_coverage(entry, gap_from, covered_to, cutoff)
+                    changed = True
+            finally:
+                if changed:
+                    self._save(url, entry, collapse_daily)
+
+        found = select(
+            s for ts, s in entry['snapshots'].items() if lo <= ts <= hi
+        )
+        return found[:limit] if limit else found
+
+    def peek(self, url, from_timestamp, to_timestamp, limit):
+        """Snapshots in the window if the cache alone can answer, else None."""
+        def fetch(**kwargs):
+            raise _CdxCacheGap(url)
+
+        try:
+            return self.lookup(url, from_timestamp, to_timestamp, limit, fetch)
+        except (_CdxCacheGap, CdxCacheMiss):
+            return None
+
+    def record(self, url, from_timestamp, to_timestamp, snapshots):
+        """Store the complete result of an unlimited query for the window."""
+        lo = _window_bound(from_timestamp, upper=False)
+        hi = _window_bound(to_timestamp, upper=True)
+
+        with self._lock:
+            url_lock = self._url_locks.setdefault(url, threading.Lock())
+
+        with url_lock:
+            entry = self._load(url)
+            for snap in snapshots:
+                entry['snapshots'][snap['timestamp']] = snap
+            _add_coverage(entry, lo, hi, _coverage_cutoff())
+            self._save(url, entry)
+
+
+class CdxCacheMiss(RequestException):
+    """Raised in offline mode when the CDX cache does not cover a window."""
+
+
+class _CdxCacheGap(Exception):
+    """Raised by CdxIndexCache.peek when answering would need a query."""
+
+
+_cdx_cache = None
+
+
+def set_cdx_cache(cache):
+    """Use ``cache`` (a CdxIndexCache, or None to disable) for CDX queries."""
+    global _cdx_cache
+    _cdx_cache = cache
+
+
+###############################################################################
+# WAYBACK SNAPSHOT FUNCTIONS
+###############################################################################
+
+CDX_API_URL = 'https://web.archive.org/cdx/search/cdx'
+
+
+class _CdxJsonError(ValueError):
+    """CDX API answered with something that is not the expected JSON."""
+
+
+def _query_cdx(url, user_agent='ResearchScraper/1.0', limit=None,
+               from_timestamp=None, to_timestamp=None, timeout=30, session=None,
+               collapse_daily=True):
+    """
+    Single CDX API query (see get_cdx_snapshots), streamed page by page.
+
+    Raises:
+        RequestException on network or HTTP errors, _CdxJsonError on a
+        malformed body
+    """
+    page_size = min(limit, DEFAULT_CDX_PAGE_SIZE) if limit else DEFAULT_CDX_PAGE_SIZE
+    snapshots = iter_cdx_snapshots(url, user_agent=user_agent,
+                                   from_timestamp=from_timestamp,
+                                   to_timestamp=to_timestamp, timeout=timeout,
+                                   session=session, page_size=page_size,
+                                   collapse_daily=collapse_daily)
+    return list(itertools.islice(snapshots, limit) if limit else snapshots)
+
+
+def _lookup_cdx_snapshots(url, user_agent='ResearchScraper/1.0', limit=None,
+                          from_timestamp=None, to_timestamp=None, timeout=30,
+                          session=None, collapse_daily=True):
+    """
+    get_cdx_snapshots without the error handling.
+
+    An empty list is therefore a real answer: the archive has no snapshots
+    in the window. With ``collapse_daily=False`` every capture is returned,
+    not only the first of each day.
+
+    Raises:
+        RequestException on network or HTTP errors (CdxCacheMiss offline),
+        _CdxJsonError on a malformed body
+    """
+    fetch = functools.partial(_query_cdx, url, user_agent=user_agent,
+                              timeout=timeout, session=session,
+                              collapse_daily=collapse_daily)
+    if _cdx_cache is not None:
+        return _cdx_cache.lookup(url, from_timestamp, to_timestamp, limit, fetch,
+                                 collapse_daily=collapse_daily)
+    return fetch(limit=limit, from_timestamp=from_timestamp, to_timestamp=to_timestamp)
+
+
+def get_cdx_snapshots(url, user_agent='ResearchScraper/1.0', limit=None,
+                      from_timestamp=None, to_timestamp=None, timeout=30,
+                      session=None):
+    """
+    Fetch Wayback Machine snapshots for a given URL using the CDX API.
+
+    When a CDX index cache is configured (see set_cdx_cache), only the parts
+    of the window not covered by earlier queries are fetched.
+    
+    Args:
+        url: Target URL to find snapshots for
+        user_agent: User-agent string for API requests
+        limit: Maximum number of snapshots to retrieve
+        from_timestamp: Start date (format: YYYYMMDDHHMMSS)
+        to_timestamp: End date (format: YYYYMMDDHHMMSS)
+        timeout: Request timeout in seconds
+        session: requests.Session to use (the shared pooled session if None)
+    
+    Returns:
+        List of snapshot dictionaries with 'timestamp', 'original' and
+        'digest' keys
+    """
+    try:
+        return _lookup_cdx_snapshots(url, user_agent=user_agent, limit=limit,
+                                     from_timestamp=from_timestamp,
+                                     to_timestamp=to_timestamp, timeout=timeout,
+                                     session=session)
+    except Timeout:
+        print(f"  CDX API timeout for {url}")
+    except _CdxJsonError as e:
+        print(f"  JSON parsing error for {url}: {e}")
+    except RequestException as e:
+        print(f"  CDX API error for {url}: {e}")
+    return []
+
+
+def download_wayback(url, timestamp, user_agent='ResearchScraper/1.0', timeout=30,
+                     session=None):
+    """
+    Download a specific snapshot from the Wayback Machine.
+
+    Served from the snapshot cache when one is configured (see
+    set_snapshot_cache); cacheable responses are stored after download.
+    
+    Args:
+        url: Original URL to retrieve
+        timestamp: Wayback timestamp (YYYYMMDDHHMMSS format)
+        user_agent: User-agent for the request
+        timeout: Request timeout in seconds
+        session: requests.Session to use (the shared pooled session if None)
+    
+    Returns:
+        requests.Response object
+    """
+    archive_url = f'https://web.archive.org/web/{timestamp}id_/{url}'
+    cache = _snapshot_cache
+
+    if cache is not None:
+        cached = cache.get(archive_url)
+        if cached is not None:
+            return cached
+        if cache.offline:
+            raise SnapshotCacheMiss(f"Not in offline cache: {archive_url}")
+
+    headers = {'User-Agent': user_agent}
+    resp = _archive_get(archive_url, 'snapshot', session=session,
+                        headers=headers, timeout=timeout)
+
+    # Server-side failures and throttling are not properties of the snapshot
+    if cache is not None and resp.status_code < 500 and resp.status_code != 429:
+        cache.put(archive_url, resp)
+
+    return resp
+
+
+# Homepage bytes read at most while looking for the end of <head>
+HOMEPAGE_HEAD_MAX_BYTES = 512 * 1024
+_HEAD_END = b'</head'
+
+
+def download_wayback_head(url, timestamp, user_agent='ResearchScraper/1.0', timeout=30,
+                          session=None, max_bytes=HOMEPAGE_HEAD_MAX_BYTES):
+    """
+    Download a snapshot only up to the end of its HTML ``<head>``.
+
+    The body is streamed and the connection closed as soon as ``</head>``
+    (or ``max_bytes``) has been read, which is all extract_meta_robots and
+    extract_x_robots_tag need. A full copy in the snapshot cache is used
+    when present; partial bodies are cached under their own key so they
+    never stand in for a full download.
+
+    Args:
+        Same as download_wayback, plus:
+        max_bytes: Cap on the body bytes read
+
+    Returns:
+        requests.Response object whose content is the body read so far
+    """
+    archive_url = f'https://web.archive.org/web/{timestamp}id_/{url}'
+    head_key = archive_url + '#head'
+    cache = _snapshot_cache
+
+    if cache is not None:
+        cached = cache.get_first(archive_url, head_key)
+        if cached is not None:
+            return cached
+        if cache.offline:
+            raise SnapshotCacheMiss(f"Not in offline cache: {archive_url}")
+
+    headers = {'User-Agent': user_agent}
+    resp = _archive_get(archive_url, 'snapshot', session=session,
+                        headers=headers, timeout=timeout, stream=True)
+
+    body = bytearray()
+    try:
+        for chunk in resp.iter_content(chunk_size=16384):
+            # Search from just before the chunk so a split tag is still found
+            search_from = max(0, len(body) - len(_HEAD_END))
+            body.extend(chunk)
+            if _HEAD_END in body[search_from:].lower() or len(body) >= max_bytes:
+                break
+    finally:
+        resp.close()
+    resp._content = bytes(body[:max_bytes])
+
+    if cache is not None and resp.status_code < 500 and resp.status_code != 429:
+        cache.put(head_key, resp)
+
+    return resp
+
+
+# How homepages are fetched: up to </head>, response headers only, or whole
+HOMEPAGE_FETCH_MODES = ('partial', 'headers', 'full')
+
+
+def download_wayback_headers(url, timestamp, user_agent='ResearchScraper/1.0',
+                             timeout=30, session=None):
+    """
+    Fetch only the response headers and status of a snapshot.
+
+    Issues a HEAD request, which keeps the pooled connection reusable. If
+    the archive refuses HEAD (405/501), a streamed GET is closed right after
+    its headers arrive instead. Any cached copy of the snapshot is used, and
+    header-only responses are cached under their own key.
+
+    Args:
+        Same as download_wayback
+
+    Returns:
+        requests.Response object with an empty body
+    """
+    archive_url = f'https://web.archive.org/web/{timestamp}id_/{url}'
+    headers_key = archive_url + '#headers'
+    cache = _snapshot_cache
+
+    if cache is not None:
+        cached = cache.get_first(archive_url, archive_url + '#head', headers_key)
+        if cached is not None:
+            return cached
+        if cache.offline:
+            raise SnapshotCacheMiss(f"Not in offline cache: {archive_url}")
+
+    headers = {'User-Agent': user_agent}
+    resp = _archive_get(archive_url, 'snapshot', session=session, method='HEAD',
+                        headers=headers, timeout=timeout, allow_redirects=True)
+    if resp.status_code in (405, 501):
+        resp = _archive_get(archive_url, 'snapshot', session=session,
+                            headers=headers, timeout=timeout, stream=True)
+        resp.close()
+    resp._content = b''
+
+    if cache is not None and resp.status_code < 500 and resp.status_code != 429:
+        cache.put(headers_key, resp)
+
+    return resp
+
+
+def download_homepage(url, timestamp, user_agent='ResearchScraper/1.0', timeout=30,
+                      session=None, fetch='partial'):
+    """
+    Download a homepage snapshot as ``fetch`` requires.
+
+    Args:
+        Same as download_wayback, plus:
+        fetch: 'partial' (body up to </head>, see download_wayback_head),
+            'headers' (no body, see download_wayback_headers) or 'full'
+
+    Returns:
+        requests.Response object
+    """
+    if fetch == 'partial':
+        return download_wayback_head(url, timestamp, user_agent, timeout, session=session)
+    if fetch == 'headers':
+        return download_wayback_headers(url, timestamp, user_agent, timeout,
+                                        session=session)
+    if fetch == 'full':
+        return download_wayback(url, timestamp, user_agent, timeout, session=session)
+    raise ValueError(f"homepage fetch must be one of {HOMEPAGE_FETCH_MODES}, got {fetch!r}")
+
+
+def parse_robots_txt(text):
+    """
+    Parse robots.txt content into structured rules.
+    
+    Args:
+        text: Raw robots.txt content
+    
+    Returns:
+        Dictionary mapping user-agents to their rules
+    """
+    rules = {}
+    current_agent = None
+
+    for line in text.split('\n'):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+
+        if line.lower().startswith('user-agent:'):
+            current_agent = line.split(':', 1)[1].strip()
+            rules[current_agent] = []
+        elif current_agent:
+            rules[current_agent].append(line)
+
+    return rules
+
+
+def is_html(text):
+    """Check if text content is HTML rather than plain text."""
+    try:
+        return bool(BeautifulSoup(text, 'html.parser').find())
+    except Exception:
+        return False
+
+
+def extract_meta_robots(html_text):
+    """Extract meta robots tag content from HTML."""
+    try:
+        soup = BeautifulSoup(html_text, 'html.parser')
+        meta = soup.find('meta', attrs={'name': 'robots'})
+        if meta and 'content' in meta.attrs:
+            return meta['content'].lower()
+    except Exception:
+        pass
+    return None
+
+
+def extract_x_robots_tag(headers):
+    """Extract X-Robots-Tag from HTTP headers."""
+    for key, value in headers.items():
+        if key.lower() == 'x-robots-tag':
+            return value.lower()
+    return None
+
+
+###############################################################################
+# STREAMED AND BULK CDX QUERIES
+###############################################################################
+
+DEFAULT_CDX_PAGE_SIZE = 5000    # rows per showResumeKey page
+MAX_BULK_GROUP_SIZE = 50        # hosts folded into one domain-wide query
+
+# Second-level labels under two-letter country TLDs that are not registrable
+# themselves (bbc.co.uk groups under bbc.co.uk, not co.uk)
+_GENERIC_SECOND_LEVEL = {'ac', 'co', 'com', 'edu', 'gov', 'net', 'org'}
+
+_WS = re.compile(r'\s*')
+
+
+def _iter_json_rows(resp, chunk_size=65536):
+    """
+    Yield the elements of a top-level JSON array as the body streams in.
+
+    Only the current chunk and at most one partial element are held in
+    memory, so paging through large CDX answers needs no full ``r.json()``.
+
+    Raises:
+        _CdxJsonError if the body is not a JSON array or ends early
+    """
+    decoder = json.JSONDecoder()
+    text = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    buf = ''
+    started = False
+
+    for chunk in resp.iter_content(chunk_size=chunk_size):
+        buf += text.decode(chunk)
+        pos = 0
+        while True:
+            pos = _WS.match(buf, pos).end()
+            if pos >= len(buf):
+                break
+            char = buf[pos]
+            if not started:
+                if char != '[':
+                    raise _CdxJsonError(f"expected JSON array, got {buf[pos:pos + 40]!r}")
+                started = True
+                pos += 1
+            elif char == ',':
+                pos += 1
+            elif char == ']':
+                return
+            else:
+                try:
+                    row, pos = decoder.raw_decode(buf, pos)
+                except ValueError:
+                    break       # element continues in the next chunk
+                yield row
+        buf = buf[pos:]
+
+    if started or buf.strip():
+        raise _CdxJsonError("truncated JSON array")
+
+
+def _iter_cdx_rows(params, user_agent='ResearchScraper/1.0', timeout=30,
+                   session=None, page_size=DEFAULT_CDX_PAGE_SIZE,
+                   resume_key=None, on_page=None):
+    """
+    Stream snapshot dictionaries of a CDX query, following showResumeKey pages.
+
+    Each page of at most ``page_size`` rows costs one CDX token; the resume
+    key at the end of a page starts the next one.
+
+    Args:
+        resume_key: Key to continue an earlier walk from
+        on_page: Called with the key of the next page (None after the last
+            page) once every row of a page has been yielded
+
+    Raises:
+        RequestException on network or HTTP errors, _CdxJsonError on a
+        malformed body
+    """
+    params = dict(params, output='json', showResumeKey='true', limit=page_size)
+    if resume_key:
+        params['resumeKey'] = resume_key
+    headers = {'User-Agent': user_agent}
+
+    while True:
+        r = _archive_get(CDX_API_URL, 'cdx', session=session, params=params,
+                         headers=headers, timeout=timeout, stream=True)
+        resume_key = None
+        try:
+            r.raise_for_status()
+            keys = None
+            after_rows = False
+            for row in _iter_json_rows(r):
+                if keys is None:
+                    keys = row
+                elif not row:
+                    after_rows = True       # blank row precedes the resume key
+                elif after_rows:
+                    resume_key = row[0]
+                else:
+                    yield dict(zip(keys, row))
+        finally:
+            r.close()
+
+        if on_page is not None:
+            on_page(resume_key)
+        if not resume_key:
+            return
+        params['resumeKey'] = resume_key
+
+
+def _load_cdx_state(state_file, query):
+    """Resume key saved for ``query`` in state_file, or None."""
+    try:
+        with open(state_file, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if state.get('query') != query:
+        print(f"  Ignoring CDX resume state for another query in {state_file}")
+        return None
+    return state.get('resume_key')
+
+
+def _save_cdx_state(state_file, query, resume_key):
+    """Persist the next page's resume key (or drop the state once done)."""
+    if resume_key is None:
+        if os.path.exists(state_file):
+            os.remove(state_file)
+        return
+    tmp_path = f"{state_file}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'query': query, 'resume_key': resume_key}, f)
+    os.replace(tmp_path, state_file)
+
+
+def iter_cdx_snapshots(url, user_agent='ResearchScraper/1.0', from_timestamp=None,
+                       to_timestamp=None, timeout=30, session=None,
+                       page_size=DEFAULT_CDX_PAGE_SIZE, state_file=None,
+                       collapse_daily=True):
+    """
+    Yield the daily-collapsed snapshots of a URL page by page.
+
+    Unlike get_cdx_snapshots nothing is accumulated: only one page of at
+    most ``page_size`` rows is in flight, so complete histories of very
+    popular domains can be walked without a limit.
+
+    With ``state_file`` the resume key of the next page is saved after every
+    completed page. A walk interrupted by a crash or an error continues from
+    there when called again with the same arguments; rows of the page that
+    was in progress are yielded again. The file is removed at the end.
+
+    Args:
+        url: Target URL to find snapshots for
+        page_size: Rows per CDX page
+        state_file: JSON file holding the resume position (None disables it)
+        collapse_daily: Keep only the first snapshot of each day; False
+            yields every capture
+        Other arguments as in get_cdx_snapshots
+
+    Yields:
+        Snapshot dictionaries with 'timestamp', 'original' and 'digest' keys
+
+    Raises:
+        RequestException on network or HTTP errors, ValueError on a
+        malformed body
+    """
+    params = {
+        'url': url,
+        'fl': 'timestamp,original,digest',
+    }
+    if collapse_daily:
+        params['collapse'] = 'timestamp:8'
+    if from_timestamp:
+        params['from'] = from_timestamp
+    if to_timestamp:
+        params['to'] = to_timestamp
+
+    resume_key = None
+    on_page = None
+    if state_file:
+        resume_key = _load_cdx_state(state_file, params)
+        if resume_key:
+            print(f"  Resuming CDX walk of {url} from saved position")
+        on_page = functools.partial(_save_cdx_state, state_file, params)
+
+    # The daily collapse restarts on every page, so a day can straddle two
+    last_day = None
+    for snap in _iter_cdx_rows(params, user_agent=user_agent, timeout=timeout,
+                               session=session, page_size=page_size,
+                               resume_key=resume_key, on_page=on_page):
+        if 'timestamp' not in snap or 'original' not in snap:
+            continue
+        if collapse_daily:
+            if snap['timestamp'][:8] == last_day:
+                continue
+            last_day = snap['timestamp'][:8]
+        yield snap
+
+
+def _host_key(host):
+    """Lower-cased host without port or leading 'www.', like CDX url keys."""
+    host = host.lower().split(':', 1)[0]
+    return host[4:] if host.startswith('www.') else host
+
+
+def _registrable_domain(host):
+    """Approximate registrable domain of a host (the bulk query root)."""
+    labels = host.split('.')
+    if (len(labels) >= 3 and len(labels[-1]) == 2
+            and labels[-2] in _GENERIC_SECOND_LEVEL):
+        return '.'.join(labels[-3:])
+    return '.'.join(labels[-2:])
+
+
+def _bulk_robots_query(root, hosts, from_timestamp, to_timestamp, **kwargs):
+    """
+    One paged domain-wide CDX query for the robots.txt of several hosts.
+
+    Returns:
+        Dict host key -> daily-collapsed snapshot list (for every host)
+    """
+    host_pattern = '|'.join(re.escape(host) for host in sorted(hosts))
+    params = {
+        'url': root,
+        'matchType': 'domain',
+        'fl': 'timestamp,original,digest',
+        # Java regex, matched against the whole field
+        'filter': f'original:(?i)https?://(www\\.)?({host_pattern})(:\\d+)?/robots\\.txt',
+    }
+    if from_timestamp:
+        params['from'] = from_timestamp
+    if to_timestamp:
+        params['to'] = to_timestamp
+
+    found = {host: [] for host in hosts}
+    for snap in _iter_cdx_rows(params, **kwargs):
+        if 'timestamp' not in snap or 'original' not in snap:
+            continue
+        host = _host_key(snap['original'].split('://', 1)[-1].split('/', 1)[0])
+        if host in found:
+            found[host].append(snap)
+
+    # Rows arrive sorted by host, so collapse per host rather than server-side
+    return {host: _collapse_daily(snaps) for host, snaps in found.items()}
+
+
+def get_cdx_snapshots_bulk(domains, user_agent='ResearchScraper/1.0', limit=None,
+                           from_timestamp=None, to_timestamp=None, timeout=30,
+                           session=None, page_size=DEFAULT_CDX_PAGE_SIZE):
+    """
+    Fetch robots.txt snapshot lists for many domains with few CDX queries.
+
+    Domains sharing a registrable domain (example.com, news.example.com,
+    www.example.com/...) are answered by one paged ``matchType=domain``
+    query filtered to their robots.txt URLs, instead of one query each.
+    Domains already covered by the CDX index cache are served from it, and
+    the bulk results are recorded there. Lone domains get a regular CDX
+    lookup.
+
+    Args:
+        domains: Iterable of domains as found in the input CSV
+        page_size: Rows per CDX page
+        Other arguments as in get_cdx_snapshots
+
+    Returns:
+        Dict domain -> list of snapshot dictionaries, as from
+        get_cdx_snapshots. Domains whose query failed are left out, so
+        callers can fall back to a per-domain query; an empty list always
+        means the archive has no snapshots in the window.
+    """
+    results = {}
+    groups = {}
+
+    for domain in dict.fromkeys(domains):
+        clean_domain = _clean_domain(domain)
+        if not clean_domain:
+            results[domain] = []
+            continue
+        robots_url = f'{clean_domain}/robots.txt'
+        if _cdx_cache is not None:
+            cached = _cdx_cache.peek(robots_url, from_timestamp, to_timestamp, limit)
+            if cached is not None:
+                results[domain] = cached
+                continue
+        if '/' in clean_domain:
+            key = None          # path-scoped domains only match exactly
+        else:
+            key = _host_key(clean_domain)
+        root = _registrable_domain(key) if key else domain
+        groups.setdefault(root, {}).setdefault(key, []).append(domain)
+
+    query_kwargs = dict(user_agent=user_agent, timeout=timeout, session=session)
+
+    for root, members in groups.items():
+        if len(members) == 1:
+            (key, group_domains), = members.items()
+            for domain in group_domains:
+                robots_url = f'{_clean_domain(domain)}/robots.txt'
+                try:
+                    results[domain] = _lookup_cdx_snapshots(
+                        robots_url, limit=limit, from_timestamp=from_timestamp,
+                        to_timestamp=to_timestamp, **query_kwargs
+                    )
+                except Timeout:
+                    print(f"  CDX API timeout for {robots_url}")
+                except _CdxJsonError as e:
+                    print(f"  JSON parsing error for {robots_url}: {e}")
+                except RequestException as e:
+                    print(f"  CDX API error for {robots_url}: {e}")
+            continue
+
+        hosts = list(members)
+        for start in range(0, len(hosts), MAX_BULK_GROUP_SIZE):
+            chunk = hosts[start:start + MAX_BULK_GROUP_SIZE]
+            try:
+                found = _bulk_robots_query(root, chunk, from_timestamp, to_timestamp,
+                                           page_size=page_size, **query_kwargs)
+            except Timeout:
+                print(f"  CDX API timeout for bulk query on {root}")
+                continue
+            except _CdxJsonError as e:
+                print(f"  JSON parsing error for bulk query on {root}: {e}")
+                continue
+            except RequestException as e:
+                print(f"  CDX API error for bulk query on {root}: {e}")
+                continue
+
+            for host, snapshots in found.items():
+                for domain in members[host]:
+                    if _cdx_cache is not None:
+                        _cdx_cache.record(f'{_clean_domain(domain)}/robots.txt',
+                                          from_timestamp, to_timestamp, snapshots)
+                    results[domain] = snapshots[:limit] if limit else snapshots
+
+    return results
+
+
+###############################################################################
+# MAIN SCRAPER
+###############################################################################
+
+_SCHEME_RE = re.compile(r'^\s*https?://', re.IGNORECASE)
+
+# Host with at least one dot, optional port and path (after normalization)
+_DOMAIN_RE = r'[^\s/:.]+(\.[^\s/:.]+)+(:\d+)?(/\S*)?'
+
+
+def _clean_domain(domain):
+    """Strip scheme, whitespace and trailing slashes from a domain."""
+    return _SCHEME_RE.sub('', domain).strip().strip('/')
+
+
+def _normalize_domain(domain):
+    """Identity of a domain for resume state and sharding."""
+    return _clean_domain(str(domain)).lower()
+
+
+def robots_body_hash(text):
+    """SHA-256 hex digest of a robots.txt body, as stored in robots_hash."""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def _new_snapshot_row(domain, snap):
+    """Empty output row for one robots.txt snapshot."""
+    return {
+        "domain": domain,
+        "timestamp": snap['timestamp'],
+        "scraped_url": snap['original'],
+        "robots_txt": None,
+        "raw_robots_response_text": None,
+        "robots_hash": None,
+        "robots_content_type": 'unknown',
+        "robots_rules": None,
+        "meta_robots": None,
+        "x_robots_tag": None,
+        "status_robots": None,
+        "status_home": None,
+        "error_details": None
+    }
+
+
+def _fill_robots_fields(row, resp_robots):
+    """Populate robots.txt columns of a row from the archived response."""
+    row["status_robots"] = resp_robots.status_code
+
+    if resp_robots.status_code == 200:
+        raw_robots_response_text = resp_robots.text
+        row["raw_robots_response_text"] = raw_robots_response_text
+        row["robots_hash"] = robots_body_hash(raw_robots_response_text)
+        if is_html(raw_robots_response_text):
+            row["robots_txt"] = "HTML Content (Not robots.txt)"
+            row["robots_content_type"] = "HTML_page"
+        else:
+            row["robots_txt"] = raw_robots_response_text
+            robots_rules = parse_robots_txt(raw_robots_response_text)
+            row["robots_rules"] = json.dumps(robots_rules) if robots_rules else None
+            row["robots_content_type"] = "robots.txt"
+    else:
+        row["robots_content_type"] = f"HTTP_Error_{resp_robots.status_code}"
+
+
+def _fill_home_fields(row, resp_home, meta=True, xrobots=True):
+    """Populate homepage signal columns of a row from the archived response."""
+    row["status_home"] = resp_home.status_code
+
+    if resp_home.status_code == 200:
+        if meta:
+            row["meta_robots"] = extract_meta_robots(resp_home.text)
+        if xrobots:
+            row["x_robots_tag"] = extract_x_robots_tag(resp_home.headers)
+
+
+# Signals a scrape can collect: robots.txt, meta robots tag, X-Robots-Tag header
+ALL_SIGNALS = frozenset({'robots', 'meta', 'xrobots'})
+
+
+def _check_signals(signals, homepage_fetch):
+    """Validate a signal selection and homepage fetch mode."""
+    unknown = set(signals) - ALL_SIGNALS
+    if unknown or not signals:
+        raise ValueError(f"signals must be a non-empty subset of {sorted(ALL_SIGNALS)}, "
+                         f"got {sorted(signals)}")
+    if homepage_fetch not in HOMEPAGE_FETCH_MODES:
+        raise ValueError(f"homepage_fetch must be one of {HOMEPAGE_FETCH_MODES}")
+
+
+def _homepage_fetch_for(signals, homepage_fetch):
+    """Homepage fetch mode ``signals`` needs, or None to skip the homepage."""
+    if 'meta' in signals:
+        return homepage_fetch
+    if 'xrobots' in signals:
+        return 'headers'
+    return None
+
+
+def _describe_error(exc):
+    """Short error label stored in the error_details column."""
+    if isinstance(exc, Timeout):
+        return "Timeout"
+    if isinstance(exc, ConnectionError):
+        return "ConnectionError"
+    if isinstance(exc, RequestException):
+        return f"RequestException: {str(exc)[:100]}"
+    return f"GeneralError: {str(exc)[:100]}"
+
+
+# Extra days of homepage captures looked up around a domain's snapshots
+HOMEPAGE_CAPTURE_PAD_DAYS = 31
+
+HOME_FIELDS = ("status_home", "meta_robots", "x_robots_tag")
+ROBOTS_FIELDS = ("robots_txt", "raw_robots_response_text", "robots_hash",
+                 "robots_content_type", "robots_rules", "status_robots")
+
+
+def _parse_wayback_timestamp(timestamp):
+    """datetime of a (possibly shortened) Wayback timestamp."""
+    return datetime.strptime(timestamp[:14].ljust(14, '0'), '%Y%m%d%H%M%S')
+
+
+def _homepage_capture_window(timestamps):
+    """CDX from/to covering the given timestamps plus padding on both sides."""
+    times = [_parse_wayback_timestamp(ts) for ts in timestamps]
+    pad = timedelta(days=HOMEPAGE_CAPTURE_PAD_DAYS)
+    return ((min(times) - pad).strftime('%Y%m%d%H%M%S'),
+            (max(times) + pad).strftime('%Y%m%d%H%M%S'))
+
+
+def _nearest_captures(timestamps, captures, window):
+    """
+    Map each timestamp to the nearest capture, as Wayback's redirect would.
+
+    A timestamp is only resolved when no capture outside the queried window
+    could be closer; otherwise it maps to itself and Wayback resolves it on
+    download.
+    """
+    lo, hi = (_parse_wayback_timestamp(bound) for bound in window)
+    capture_ts = sorted({c['timestamp'] for c in captures})
+    capture_times = [_parse_wayback_timestamp(ts) for ts in capture_ts]
+
+    resolved = {}
+    for ts in timestamps:
+        resolved[ts] = ts
+        t = _parse_wayback_timestamp(ts)
+        i = bisect.bisect_left(capture_times, t)
+        nearby = [j for j in (i - 1, i) if 0 <= j < len(capture_times)]
+        if not nearby:
+            continue
+        j = min(nearby, key=lambda j: abs(capture_times[j] - t))
+        if abs(capture_times[j] - t) <= min(t - lo, hi - t):
+            resolved[ts] = capture_ts[j]
+    return resolved
+
+
+def resolve_homepage_captures(clean_domain, timestamps, user_agent='ResearchScraper/1.0',
+                              timeout=30, session=None):
+    """
+    Homepage capture Wayback serves for each robots.txt snapshot timestamp.
+
+    Requesting the homepage at a robots.txt timestamp redirects to the
+    nearest homepage capture, so consecutive snapshots often land on the
+    same one. A single CDX query over the snapshots' span lets each
+    distinct capture be downloaded once. The query is not collapsed by day:
+    the nearest capture can be any capture of a day, not only its first.
+    It goes through the CDX index cache like any other lookup, so in
+    offline mode captures are resolved from cached queries only.
+
+    Args:
+        clean_domain: Domain without scheme
+        timestamps: robots.txt snapshot timestamps
+
+    Returns:
+        Dict timestamp -> capture timestamp (the timestamp itself where the
+        capture could not be determined)
+    """
+    if not timestamps:
+        return {}
+    try:
+        window = _homepage_capture_window(timestamps)
+    except ValueError:
+        return {ts: ts for ts in timestamps}
+
+    try:
+        captures = _lookup_cdx_snapshots(clean_domain, user_agent=user_agent,
+                                         from_timestamp=window[0],
+                                         to_timestamp=window[1], timeout=timeout,
+                                         session=session, collapse_daily=False)
+    except (RequestException, ValueError) as e:
+        print(f"  Homepage capture lookup failed for {clean_domain}: {e}")
+        return {ts: ts for ts in timestamps}
+    return _nearest_captures(timestamps, captures, window)
+
+
+def _scrape_snapshot(domain, clean_domain, snap, user_agent, timeout, session=None,
+                     home_timestamp=None, home_results=None, robots_results=None,
+                     homepage_fetch='partial', signals=ALL_SIGNALS,
+                     response_archive=None):
+    """
+    Download robots.txt and homepage for one snapshot and build its row.
+
+    Only the stages ``signals`` needs are fetched; columns of the others
+    stay null. The homepage is fetched at ``home_timestamp`` (the
+    snapshot's own timestamp if None) as ``homepage_fetch`` says.
+    ``home_results`` maps capture timestamps to homepage fields already
+    extracted for the domain, and ``robots_results`` maps CDX digests to
+    robots.txt fields already parsed; hits skip the download. Downloaded
+    responses are also written to ``response_archive`` if given.
+    """
+    row = _new_snapshot_row(domain, snap)
+    timestamp = snap['timestamp']
+    home_timestamp = home_timestamp or timestamp
+    digest = snap.get('digest') if robots_results is not None else None
+    home_fetch = _homepage_fetch_for(signals, homepage_fetch)
+
+    try:
+        # ------------------ ROBOTS.TXT
+        if 'robots' not in signals:
+            row["robots_content_type"] = None
+        elif digest and digest in robots_results:
+            row.update(robots_results[digest])
+        else:
+            resp_robots = download_wayback(snap['original'], timestamp, user_agent,
+                                           timeout, session=session)
+            if response_archive is not None:
+                response_archive.write(snap['original'], timestamp, resp_robots)
+            _fill_robots_fields(row, resp_robots)
+            if digest:
+                robots_results[digest] = {k: row[k] for k in ROBOTS_FIELDS}
+
+        # ------------------ HOMEPAGE
+        if home_fetch is not None:
+            if home_results is not None and home_timestamp in home_results:
+                row.update(home_results[home_timestamp])
+            else:
+                home_url = f'http://{clean_domain}'
+                resp_home = download_homepage(home_url, home_timestamp, user_agent,
+                                              timeout, session=session, fetch=home_fetch)
+                if response_archive is not None:
+                    response_archive.write(home_url, home_timestamp, resp_home,
+                                           truncated=home_fetch != 'full')
+                _fill_home_fields(row, resp_home,
+                                  meta='meta' in signals and home_fetch != 'headers',
+                                  xrobots='xrobots' in signals)
+                if home_results is not None:
+                    home_results[home_timestamp] = {k: row[k] for k in HOME_FIELDS}
+
+    except Exception as e:
+        row["error_details"] = _describe_error(e)
+
+    return row
+
+
+def scrape_robots_and_signals(domain, max_snapshots=50,
+                              from_timestamp=None, to_timestamp=None,
+                              timeout=30, session=None, snapshots=None,
+                              resolve_homepages=True, changes_only=False,
+                              homepage_fetch='partial', signals=ALL_SIGNALS,
+                              skip_timestamps=None, on_row=None,
+                              response_archive=None):
+    """
+    Scrape historical robots.txt and web governance signals for a domain.
+    
+    This function:
+    1. Fetches Wayback snapshots of robots.txt
+    2. Downloads and parses each snapshot
+    3. Also checks homepage for meta robots and X-Robots-Tag
+    
+    Args:
+        domain: Domain to scrape (e.g., 'example.com')
+        max_snapshots: Maximum number of snapshots to process
+        from_timestamp: Start date (YYYYMMDDHHMMSS)
+        to_timestamp: End date (YYYYMMDDHHMMSS)
+        timeout: Request timeout in seconds
+        session: requests.Session to use (the shared pooled session if None)
+        snapshots: Snapshot list already fetched for this domain (e.g. by
+            get_cdx_snapshots_bulk); the CDX API is queried if None
+        resolve_homepages: Resolve homepage requests to their actual captures
+            and download each distinct capture once (see
+            resolve_homepage_captures)
+        changes_only: Download one robots.txt body per distinct CDX digest
+            and fill the rows of identical snapshots from its parse
+        homepage_fetch: 'partial' reads homepages up to </head>, 'headers'
+            sends header-only requests and leaves meta_robots empty, 'full'
+            downloads whole homepages
+        signals: Subset of ALL_SIGNALS to collect ('robots', 'meta',
+            'xrobots'); fetch stages no selected signal needs are skipped and
+            their columns left null. Without 'meta' the homepage is fetched
+            header-only, and without 'meta' and 'xrobots' not at all.
+        skip_timestamps: Timestamps among the selected snapshots that were
+            already scraped; they are neither fetched nor returned
+        on_row: Called with each row as soon as its snapshot is scraped
+        response_archive: ResponseArchive receiving every downloaded
+            robots.txt and homepage response, headers included, so
+            snapshots can be re-parsed later without downloading them again
+    
+    Returns:
+        pandas DataFrame with schema matching ROBOTS_SCRAPE_SCHEMA
+    """
+    _check_signals(signals, homepage_fetch)
+
+    # Clean and validate domain
+    clean_domain = _clean_domain(domain)
+    if not clean_domain:
+        return pd.DataFrame()
+    
+    robots_url = f'{clean_domain}/robots.txt'
+    user_agent = 'ResearchScraper/1.0'
+
+    if snapshots is None:
+        snapshots = get_cdx_snapshots(
+            robots_url,
+            user_agent=user_agent,
+            limit=max_snapshots,
+            from_timestamp=from_timestamp,
+            to_timestamp=to_timestamp,
+            timeout=timeout,
+            session=session
+        )
+    elif max_snapshots:
+        snapshots = snapshots[:max_snapshots]
+
+    if skip_timestamps:
+        snapshots = [snap for snap in snapshots if snap['timestamp'] not in skip_timestamps]
+
+    if not snapshots:
+        return pd.DataFrame()
+
+    home_captures = {}
+    # With a single snapshot there is nothing to deduplicate
+    if resolve_homepages and len(snapshots) > 1 and _homepage_fetch_for(signals,
+                                                                         homepage_fetch):
+        home_captures = resolve_homepage_captures(
+            clean_domain, [snap['timestamp'] for snap in snapshots],
+            user_agent=user_agent, timeout=timeout, session=session
+        )
+
+    data = []
+    home_results = {}
+    robots_results = {} if changes_only and 'robots' in signals else None
+
+    for snap in snapshots:
+        row = _scrape_snapshot(domain, clean_domain, snap, user_agent, timeout,
+                               session=session,
+                               home_timestamp=home_captures.get(snap['timestamp']),
+                               home_results=home_results,
+                               robots_results=robots_results,
+                               homepage_fetch=homepage_fetch,
+                               signals=signals,
+                               response_archive=response_archive)
+        if on_row is not None:
+            on_row(row)
+        data.append(row)
+
+    return pd.DataFrame(data)
+
+
+###############################################################################
+# ASYNCIO CLIENT
+###############################################################################
+
+class AsyncWaybackClient:
+    """
+    Asyncio front-end for the Wayback Machine functions.
+
+    Coroutines hand blocking requests to a bounded thread pool backed by one
+    pooled session (see create_session), so any number of awaited CDX and
+    snapshot fetches share at most ``max_connections`` keep-alive
+    connections. All requests still draw from the global request budget.
+
+    Usage:
+        async with AsyncWaybackClient(max_connections=8) as client:
+            snapshots = await client.get_cdx_snapshots('example.com/robots.txt')
+    """
+
+    def __init__(self, max_connections=10):
+        self.max_connections = max_connections
+        self._executor = ThreadPoolExecutor(max_workers=max_connections)
+        self.session = create_session(pool_size=max_connections)
+
+    async def _run(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        call = functools.partial(func, *args, session=self.session, **kwargs)
+        return await loop.run_in_executor(self._executor, call)
+
+    async def get_cdx_snapshots(self, url, **kwargs):
+        """Async variant of get_cdx_snapshots (same arguments)."""
+        return await self._run(get_cdx_snapshots, url, **kwargs)
+
+    async def download_wayback(self, url, timestamp, response_archive=None, **kwargs):
+        """Async download_wayback, also writing to ``response_archive``."""
+        return await self._run(_archived_download, download_wayback, response_archive,
+                               url, timestamp, **kwargs)
+
+    async def download_homepage(self, url, timestamp, response_archive=None, **kwargs):
+        """Async download_homepage, also writing to ``response_archive``."""
+        return await self._run(_archived_download, download_homepage, response_archive,
+                               url, timestamp,
+                               truncated=kwargs.get('fetch', 'partial') != 'full', **kwargs)
+
+    async def resolve_homepage_captures(self, clean_domain, timestamps, **kwargs):
+        """Async variant of resolve_homepage_captures (same arguments)."""
+        return await self._run(resolve_homepage_captures, clean_domain, timestamps,
+                               **kwargs)
+
+    def close(self):
+        """Release worker threads and pooled connections."""
+        self._executor.shutdown(wait=True)
+        self.session.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        # Joining the workers blocks, so do it off the event loop
+        await asyncio.get_running_loop().run_in_executor(None, self.close)
+
+
+def _archived_download(download, response_archive, url, timestamp, truncated=False,
+                       **kwargs):
+    """Call ``download`` and write its response to ``response_archive``."""
+    resp = download(url, timestamp, **kwargs)
+    if response_archive is not None:
+        response_archive.write(url, timestamp, resp, truncated=truncated)
+    return resp
+
+
+_shared_async_client = None
+
+
+def get_shared_async_client():
+    """Module-wide AsyncWaybackClient used when no client is passed."""
+    global _shared_async_client
+    with _shared_session_lock:
+        if _shared_async_client is None:
+            _shared_async_client = AsyncWaybackClient()
+        return _shared_async_client
+
+
+async def async_get_cdx_snapshots(url, user_agent='ResearchScraper/1.0', limit=None,
+                                  from_timestamp=None, to_timestamp=None, timeout=30,
+                                  client=None):
+    """
+    Async variant of get_cdx_snapshots.
+
+    Args:
+        Same as get_cdx_snapshots, plus:
+        client: AsyncWaybackClient to use (see get_shared_async_client if None)
+    """
+    client = client or get_shared_async_client()
+    return await client.get_cdx_snapshots(url, user_agent=user_agent, limit=limit,
+                                          from_timestamp=from_timestamp,
+                                          to_timestamp=to_timestamp, timeout=timeout)
+
+
+async def async_download_wayback(url, timestamp, user_agent='ResearchScraper/1.0',
+                                 timeout=30, client=None):
+    """
+    Async variant of download_wayback.
+
+    Args:
+        Same as download_wayback, plus:
+        client: AsyncWaybackClient to use (see get_shared_async_client if None)
+    """
+    client = client or get_shared_async_client()
+    return await client.download_wayback(url, timestamp, user_agent=user_agent,
+                                         timeout=timeout)
+
+
+async def _async_scrape_snapshot(client, domain, clean_domain, snap, user_agent, timeout,
+                                 home_download=None, robots_download=None,
+                                 homepage_fetch='partial', signals=ALL_SIGNALS,
+                                 response_archive=None):
+    """
+    Fetch robots.txt and homepage for one snapshot concurrently.
+
+    ``home_download`` and ``robots_download`` are awaitable downloads shared
+    by snapshots resolving to the same homepage capture or robots.txt
+    digest; each is fetched at the snapshot's own timestamp if None. Stages
+    ``signals`` does not need are skipped. Responses downloaded here are
+    written to ``response_archive`` if given.
+    """
+    row = _new_snapshot_row(domain, snap)
+    timestamp = snap['timestamp']
+    home_url = f'http://{clean_domain}'
+    fetch_robots = 'robots' in signals
+    home_fetch = _homepage_fetch_for(signals, homepage_fetch)
+
+    if home_fetch is None:
+        home_download = asyncio.sleep(0)        # resolves to None
+    elif home_download is None:
+        home_download = client.download_homepage(home_url, timestamp,
+                                                 user_agent=user_agent, timeout=timeout,
+                                                 fetch=home_fetch,
+                                                 response_archive=response_archive)
+    if not fetch_robots:
+        robots_download = asyncio.sleep(0)
+    elif robots_download is None:
+        robots_download = client.download_wayback(snap['original'], timestamp,
+                                                  user_agent=user_agent, timeout=timeout,
+                                                  response_archive=response_archive)
+
+    resp_robots, resp_home = await asyncio.gather(
+        robots_download,
+        home_download,
+        return_exceptions=True
+    )
+
+    # Same precedence as the sequential path: robots.txt first, then homepage
+    try:
+        if not fetch_robots:
+            row["robots_content_type"] = None
+        elif isinstance(resp_robots, BaseException):
+            raise resp_robots
+        else:
+            _fill_robots_fields(row, resp_robots)
+
+        if isinstance(resp_home, BaseException):
+            raise resp_home
+        if home_fetch is not None:
+            _fill_home_fields(row, resp_home,
+                              meta='meta' in signals and home_fetch != 'headers',
+                              xrobots='xrobots' in signals)
+
+    except Exception as e:
+        row["error_details"] = _describe_error(e)
+
+    return row
+
+
+async def async_scrape_robots_and_signals(domain, max_snapshots=50,
+                                          from_timestamp=None, to_timestamp=None,
+                                          timeout=30, client=None,
+                                          resolve_homepages=True, changes_only=False,
+                                          homepage_fetch='partial', signals=ALL_SIGNALS,
+                                          response_archive=None):
+    """
+    Async variant of scrape_robots_and_signals.
+
+    All snapshots of the domain are in flight at once, and each snapshot's
+    robots.txt and homepage downloads overlap instead of running back to back.
+    Snapshots resolving to the same homepage capture share one download, as
+    do snapshots with the same robots.txt digest in changes-only mode.
+
+    Args:
+        domain, max_snapshots, from_timestamp, to_timestamp, timeout,
+        resolve_homepages, changes_only, homepage_fetch, signals,
+        response_archive: As in scrape_robots_and_signals (session,
+            snapshots, skip_timestamps and on_row are not supported)
+        client: AsyncWaybackClient to use (see get_shared_async_client if None)
+
+    Returns:
+        pandas DataFrame with schema matching ROBOTS_SCRAPE_SCHEMA
+    """
+    client = client or get_shared_async_client()
+    _check_signals(signals, homepage_fetch)
+    home_fetch = _homepage_fetch_for(signals, homepage_fetch)
+
+    clean_domain = _clean_domain(domain)
+    if not clean_domain:
+        return pd.DataFrame()
+
+    user_agent = 'ResearchScraper/1.0'
+
+    snapshots = await client.get_cdx_snapshots(
+        f'{clean_domain}/robots.txt',
+        user_agent=user_agent,
+        limit=max_snapshots,
+        from_timestamp=from_timestamp,
+        to_timestamp=to_timestamp,
+        timeout=timeout
+    )
+
+    if not snapshots:
+        return pd.DataFrame()
+
+    home_downloads = {}
+    if resolve_homepages and len(snapshots) > 1 and home_fetch is not None:
+        home_captures = await client.resolve_homepage_captures(
+            clean_domain, [snap['timestamp'] for snap in snapshots],
+            user_agent=user_agent, timeout=timeout
+        )
+        for capture in set(home_captures.values()):
+            home_downloads[capture] = asyncio.ensure_future(client.download_homepage(
+                f'http://{clean_domain}', capture, user_agent=user_agent, timeout=timeout,
+                fetch=home_fetch, response_archive=response_archive
+            ))
+        home_downloads = {ts: home_downloads[capture]
+                          for ts, capture in home_captures.items()}
+
+    robots_downloads = {}
+    if changes_only and 'robots' in signals:
+        for snap in snapshots:
+            digest = snap.get('digest')
+            if digest and digest not in robots_downloads:
+                robots_downloads[digest] = asyncio.ensure_future(client.download_wayback(
+                    snap['original'], snap['timestamp'],
+                    user_agent=user_agent, timeout=timeout,
+                    response_archive=response_archive
+                ))
+
+    data = await asyncio.gather(*(
+        _async_scrape_snapshot(client, domain, clean_domain, snap, user_agent, timeout,
+                               home_download=home_downloads.get(snap['timestamp']),
+                               robots_download=robots_downloads.get(snap.get('digest')),
+                               homepage_fetch=homepage_fetch, signals=signals,
+                               response_archive=response_archive)
+        for snap in snapshots
+    ))
+
+    return pd.DataFrame(list(data))
+
+
+###############################################################################
+# OUTPUT HELPERS
+###############################################################################
+
+def _fsync_file(path):
+    """Force a file's contents to disk."""
+    with open(path, 'rb') as f:
+        os.fsync(f.fileno())
+
+
+def _fsync_dir(directory):
+    """Force a directory's entries (e.g. a rename into it) to disk."""
+    if os.name == 'posix':
+        fd = os.open(directory or '.', os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+def _replace_durably(tmp_path, path):
+    """Rename a fully written temp file over ``path`` so it survives a crash."""
+    _fsync_file(tmp_path)
+    os.replace(tmp_path, path)
+    _fsync_dir(os.path.dirname(path))
+
+
+def _with_datetime(df):
+    """Add the human-readable datetime column derived from the timestamp."""
+    return df.assign(datetime=pd.to_datetime(
+        df['timestamp'],
+        format='%Y%m%d%H%M%S',
+        errors='coerce'
+    ))
+
+
+def _typed_rows(frames):
+    """
+    Buffered row frames as one frame ready to write.
+
+    Adds the datetime column and makes the integer columns nullable
+    integers, so a missing status never turns '200' into '200.0'.
+    """
+    df = _with_datetime(pd.concat(frames, ignore_index=True))
+    for column, kind in ROBOTS_SCRAPE_SCHEMA.items():
+        if kind == 'int':
+            df[column] = pd.to_numeric(df[column]).astype('Int64')
+    return df
+
+
+class RobotsBlobStore:
+    """
+    Content-addressed store of robots.txt bodies.
+
+    Each distinct body is kept once, gzip-compressed, under its
+    ``robots_hash``. Rows written with a blob store carry only the hash:
+    ``robots_txt`` and ``raw_robots_response_text`` are left empty and can
+    be restored with ``restore_robots_bodies``. Writes go through a temp
+    file and rename, so several processes can share one store.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        ensure_dir_exists(directory)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + '.txt.gz')
+
+    def __contains__(self, key):
+        return os.path.exists(self._path(key))
+
+    def put(self, text):
+        """Store a body if it is new and return its hash."""
+        key = robots_body_hash(text)
+        path = self._path(key)
+        if not os.path.exists(path):
+            ensure_dir_exists(os.path.dirname(path))
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(gzip.compress(text.encode('utf-8')))
+            _replace_durably(tmp_path, path)
+        return key
+
+    def get(self, key):
+        """Body stored under ``key``; raises KeyError if it is missing."""
+        try:
+            with open(self._path(key), 'rb') as f:
+                return gzip.decompress(f.read()).decode('utf-8')
+        except FileNotFoundError:
+            raise KeyError(key) from None
+
+
+def _store_robots_bodies(df, blob_store):
+    """Move the robots.txt bodies of ``df`` into ``blob_store``."""
+    for text in df['raw_robots_response_text'].dropna().unique():
+        blob_store.put(text)
+    return df.assign(robots_txt=None, raw_robots_response_text=None)
+
+
+def restore_robots_bodies(df, blob_store):
+    """
+    Refill the robots.txt text columns of rows written with a blob store.
+
+    Args:
+        df: Output rows with a robots_hash column
+        blob_store: RobotsBlobStore (or its directory) the run wrote to
+
+    Returns:
+        Copy of ``df`` with robots_txt and raw_robots_response_text restored
+    """
+    if not isinstance(blob_store, RobotsBlobStore):
+        blob_store = RobotsBlobStore(blob_store)
+    bodies = {key: blob_store.get(key) for key in df['robots_hash'].dropna().unique()}
+    raw = df['robots_hash'].map(bodies)
+    html = df['robots_content_type'] == 'HTML_page'
+    return df.assign(
+        raw_robots_response_text=raw,
+        robots_txt=raw.where(~html, "HTML Content (Not robots.txt)")
+    )
+
+
+OUTPUT_FORMATS = ('csv', 'parquet', 'sqlite')
+DEFAULT_CSV_FLUSH_ROWS = 500
+DEFAULT_PARQUET_ROW_GROUP = 50000
+DEFAULT_SQLITE_BATCH_ROWS = 1000
+
+# Seconds buffered rows may wait before they are flushed anyway. Parquet
+# parts are only written by size: a time threshold would cut a slow sweep
+# into thousands of tiny part files.
+DEFAULT_FLUSH_INTERVALS = {'csv': 60, 'parquet': None, 'sqlite': 60}
+
+# Columns stored dictionary-encoded in Parquet (few distinct values)
+PARQUET_DICTIONARY_COLUMNS = ['domain', 'robots_content_type']
+
+
+class CsvOutput:
+    """
+    Appends rows to a single CSV file kept open for the whole run.
+
+    Rows are buffered and written ``flush_rows`` at a time in one write,
+    which is then fsynced, instead of reopening the file for every domain.
+    The commit state is the file size; rolling back truncates the rows
+    appended after it.
+
+    Raises:
+        ValueError: if ``path`` already has a header other than
+            ROBOTS_SCRAPE_SCHEMA, e.g. one written before a column was added
+    """
+
+    def __init__(self, path, flush_rows=DEFAULT_CSV_FLUSH_ROWS):
+        if os.path.exists(path) and os.path.getsize(path):
+            header = list(pd.read_csv(path, nrows=0).columns)
+            if header != list(ROBOTS_SCRAPE_SCHEMA):
+                raise ValueError(f"{path} has columns {header}, not ROBOTS_SCRAPE_SCHEMA; "
+                                 f"write to a new file or migrate the existing one")
+        self.path = path
+        self.flush_rows = flush_rows
+        self._frames = []
+        self.pending_rows = 0
+        self._file = open(path, 'a', encoding='utf-8', newline='')
+        self._size = os.fstat(self._file.fileno()).st_size
+
+    def write(self, df):
+        self._frames.append(df)
+        self.pending_rows += len(df)
+
+    def flush(self):
+        """Append all pending rows and force them to disk."""
+        if not self.pending_rows:
+            return
+        df = _typed_rows(self._frames)
+        df.to_csv(self._file, index=False, header=self._size == 0)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._size = os.fstat(self._file.fileno()).st_size
+
+        self._frames = []
+        self.pending_rows = 0
+
+    def commit_state(self):
+        """Size of the file with every flushed row."""
+        return self._size
+
+    def rollback(self, state):
+        """Drop rows appended after the commit that returned ``state``."""
+        if state is None or self._size <= state:
+            return
+        print(f"Rolling back {self._size - state} uncommitted bytes of {self.path}")
+        self._file.close()
+        os.truncate(self.path, state)
+        self._file = open(self.path, 'a', encoding='utf-8', newline='')
+        self._size = state
+
+    def close(self):
+        self.flush()
+        self._file.close()
+
+
+class ParquetOutput:
+    """
+    Writes rows as Parquet part files in a directory.
+
+    Rows are buffered until ``row_group_size`` of them are pending and then
+    written as one part file holding a single row group, through a temp
+    file that is fsynced and renamed. ``domain`` and ``robots_content_type`` are
+    dictionary-encoded and every column is zstd-compressed, so the large
+    robots.txt text columns shrink considerably, and readers can load only
+    the columns they need (``pd.read_parquet(directory, columns=[...])``).
+
+    Requires pyarrow.
+    """
+
+    def __init__(self, directory, row_group_size=DEFAULT_PARQUET_ROW_GROUP):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise ImportError("Parquet output requires pyarrow "
+                              "(pip install pyarrow)") from e
+        self._pa = pa
+        self._pq = pq
+        self.directory = directory
+        self.flush_rows = row_group_size
+        self._frames = []
+        self.pending_rows = 0
+        ensure_dir_exists(directory)
+
+        for name in os.listdir(directory):
+            if name.endswith('.tmp'):
+                os.remove(os.path.join(directory, name))
+        self._next_part = 1 + max(self._parts(), default=-1)
+
+        types = {'int': pa.int64(), 'datetime': pa.timestamp('ns')}
+        self.schema = pa.schema([
+            (column, types.get(kind, pa.string()))
+            for column, kind in ROBOTS_SCRAPE_SCHEMA.items()
+        ])
+
+    def _parts(self):
+        """Sequence numbers of the part files in the directory."""
+        return [int(name[5:-8]) for name in os.listdir(self.directory)
+                if name.startswith('part-') and name.endswith('.parquet')]
+
+    def write(self, df):
+        self._frames.append(df)
+        self.pending_rows += len(df)
+
+    def flush(self):
+        """Write all pending rows as the next part file."""
+        if not self.pending_rows:
+            return
+        df = _typed_rows(self._frames)
+        for field in self.schema:
+            if field.type == self._pa.string():
+                df[field.name] = df[field.name].astype('string')
+        table = self._pa.Table.from_pandas(df[self.schema.names], schema=self.schema,
+                                           preserve_index=False)
+
+        path = os.path.join(self.directory, f"part-{self._next_part:06d}.parquet")
+        tmp_path = path + '.tmp'
+        self._pq.write_table(table, tmp_path, row_group_size=len(df),
+                             compression='zstd',
+                             use_dictionary=PARQUET_DICTIONARY_COLUMNS)
+        _replace_durably(tmp_path, path)
+
+        self._next_part += 1
+        self._frames = []
+        self.pending_rows = 0
+
+    def commit_state(self):
+        """Sequence number of the next part file."""
+        return self._next_part
+
+    def rollback(self, state):
+        """Remove part files written after the commit returning ``state``."""
+        if state is None:
+            return
+        for part in self._parts():
+            if part >= state:
+                print(f"Removing uncommitted part-{part:06d}.parquet")
+                os.remove(os.path.join(self.directory, f"part-{part:06d}.parquet"))
+        self._next_part = state
+
+    def close(self):
+        self.flush()
+
+
+SQLITE_TABLE = 'robots'
+_SQLITE_TYPES = {'int': 'INTEGER'}
+
+
+class SqliteOutput:
+    """
+    Writes rows into a SQLite database, one row per (domain, timestamp).
+
+    The database runs in WAL mode, so analysis code can query it while a
+    scrape is writing. Rows are buffered and written ``batch_rows`` at a
+    time in a single transaction, as upserts: a snapshot scraped again (a
+    retried row, or a resumed run) replaces its earlier row instead of
+    duplicating it. ``datetime`` is stored as ISO text ('YYYY-MM-DD
+    HH:MM:SS'), and the table is indexed on (domain, datetime) and on
+    datetime, so per-domain lookups such as latest_robots_before take
+    milliseconds.
+    """
+
+    def __init__(self, path, batch_rows=DEFAULT_SQLITE_BATCH_ROWS):
+        self.path = path
+        self.flush_rows = batch_rows
+        self._frames = []
+        self.pending_rows = 0
+        self.columns = list(ROBOTS_SCRAPE_SCHEMA)
+
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=FULL")
+        column_defs = ', '.join(f"{column} {_SQLITE_TYPES.get(kind, 'TEXT')}"
+                                for column, kind in ROBOTS_SCRAPE_SCHEMA.items())
+        with self._conn:
+            self._conn.execute(f"CREATE TABLE IF NOT EXISTS {SQLITE_TABLE} "
+                               f"({column_defs}, PRIMARY KEY (domain, timestamp))")
+            self._conn.execute(f"CREATE INDEX IF NOT EXISTS {SQLITE_TABLE}_domain_datetime "
+                               f"ON {SQLITE_TABLE} (domain, datetime)")
+            self._conn.execute(f"CREATE INDEX IF NOT EXISTS {SQLITE_TABLE}_datetime "
+                               f"ON {SQLITE_TABLE} (datetime)")
+
+        updates = ', '.join(f"{column}=excluded.{column}" for column in self.columns
+                            if column not in ('domain', 'timestamp'))
+        self._upsert = (f"INSERT INTO {SQLITE_TABLE} ({', '.join(self.columns)}) "
+                        f"VALUES ({', '.join('?' * len(self.columns))}) "
+                        f"ON CONFLICT (domain, timestamp) DO UPDATE SET {updates}")
+
+    def write(self, df):
+        self._frames.append(df)
+        self.pending_rows += len(df)
+
+    def flush(self):
+        """Upsert all pending rows in one transaction."""
+        if not self.pending_rows:
+            return
+        df = _typed_rows(self._frames)
+        df['datetime'] = df['datetime'].dt.strftime('%Y-%m-%d %H:%M:%S')
+        df = df[self.columns].astype(object).where(df[self.columns].notna(), None)
+        with self._conn:
+            self._conn.executemany(self._upsert, df.itertuples(index=False, name=None))
+
+        self._frames = []
+        self.pending_rows = 0
+
+    def commit_state(self):
+        """Nothing to track: rows written again simply replace themselves."""
+        return None
+
+    def rollback(self, state):
+        pass
+
+    def close(self):
+        self.flush()
+        self._conn.close()
+
+
+def latest_robots_before(db_path, domain, before):
+    """
+    Latest robots.txt captured for a domain before a date, from a SQLite output.
+
+    Args:
+        db_path: Database written with output_format='sqlite'
+        domain: Domain to look up (normalized like the scrape input)
+        before: Date or datetime (anything pandas.Timestamp accepts)
+
+    Returns:
+        Dict of the row's columns, or None if there is no such capture
+    """
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    try:
+        row = conn.execute(
+            f"SELECT * FROM {SQLITE_TABLE} WHERE domain = ? AND datetime < ? "
+            f"AND robots_content_type = 'robots.txt' ORDER BY datetime DESC LIMIT 1",
+            (_normalize_domain(domain), str(pd.Timestamp(before)))
+        ).fetchone()
+    finally:
+        conn.close()
+    return dict(row) if row is not None else None
+
+
+def _open_output(path, output_format, flush_rows=None):
+    """Output object for ``output_format`` writing to ``path``."""
+    if output_format == 'csv':
+        return CsvOutput(path, flush_rows=flush_rows or DEFAULT_CSV_FLUSH_ROWS)
+    if output_format == 'parquet':
+        return ParquetOutput(path, row_group_size=flush_rows or DEFAULT_PARQUET_ROW_GROUP)
+    if output_format == 'sqlite':
+        return SqliteOutput(path, batch_rows=flush_rows or DEFAULT_SQLITE_BATCH_ROWS)
+    raise ValueError(f"output_format must be one of {OUTPUT_FORMATS}")
+
+
+def _log_domain_error(error_log_file, domain, message):
+    """Record a failed domain in the error log."""
+    with open(error_log_file, 'a') as err_log:
+        err_log.write(f"{domain}: {message}\n")
+
+
+###############################################################################
+# RETRY QUEUE FOR TRANSIENT FAILURES
+###############################################################################
+
+# error_details values worth another attempt later in the batch
+TRANSIENT_ERRORS = ("Timeout", "ConnectionError")
+
+
+class SnapshotRetryQueue:
+    """
+    Deferred re-fetch of snapshots that failed with a transient error.
+
+    Failed rows are held back from the output and journaled to ``path`` so
+    that a crashed run still retries them on resume. ``drain`` re-fetches
+    only those snapshots, giving each (domain, timestamp) at most
+    ``max_attempts`` further tries, and returns the final rows.
+    """
+
+    def __init__(self, path, max_attempts=3):
+        self.path = path
+        self.max_attempts = max_attempts
+        self._entries = {}
+
+        for line in _load_log_lines(path):
+            if line.strip():
+                row = json.loads(line)
+                self._entries[(row['domain'], row['timestamp'])] = row
+        if self._entries:
+            print(f"Loaded {len(self._entries)} snapshots awaiting retry")
+
+    def __len__(self):
+        return len(self._entries)
+
+    def defer_transient(self, df):
+        """
+        Move transiently failed rows of a domain's result into the queue.
+
+        Returns:
+            DataFrame with the remaining rows
+        """
+        transient = df['error_details'].isin(TRANSIENT_ERRORS)
+        if not transient.any():
+            return df
+
+        rows = df[transient].to_dict('records')
+        with open(self.path, 'a', encoding='utf-8') as f:
+            _append_log_lines(f, [json.dumps(row, default=str) for row in rows])
+        for row in rows:
+            self._entries[(row['domain'], row['timestamp'])] = row
+
+        return df[~transient]
+
+    def retain(self, keep):
+        """
+        Drop queued snapshots for which ``keep(domain, timestamp)`` is false.
+
+        The queue file is rewritten through a temp file and rename.
+        """
+        entries = {key: row for key, row in self._entries.items() if keep(*key)}
+        if len(entries) == len(self._entries):
+            return
+        print(f"Dropping {len(self._entries) - len(entries)} stale retry entries")
+        self._entries = entries
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(''.join(json.dumps(row, default=str) + '\n' for row in entries.values()))
+        _replace_durably(tmp_path, self.path)
+
+    def drain(self, session=None, timeout=30, max_workers=1, homepage_fetch='partial',
+              signals=ALL_SIGNALS, response_archive=None):
+        """
+        Re-fetch queued snapshots until they succeed or run out of attempts.
+
+        Returns:
+            DataFrame with one row per queued snapshot (the last attempt)
+        """
+        pending = list(self._entries.values())
+        final_rows = []
+
+        def refetch(row):
+            snap = {'timestamp': row['timestamp'], 'original': row['scraped_url']}
+            return _scrape_snapshot(row['domain'], _clean_domain(row['domain']),
+                                    snap, 'ResearchScraper/1.0', timeout,
+                                    session=session, homepage_fetch=homepage_fetch,
+                                    signals=signals, response_archive=response_archive)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for attempt in range(1, self.max_attempts + 1):
+                if not pending:
+                    break
+                print(f"\n>>> Retry round {attempt}: {len(pending)} snapshots")
+                rows = list(executor.map(refetch, pending))
+                pending = []
+                for row in rows:
+                    if row['error_details'] in TRANSIENT_ERRORS and attempt < self.max_attempts:
+                        pending.append(row)
+                    else:
+                        final_rows.append(row)
+
+        return pd.DataFrame(final_rows)
+
+    def clear(self):
+        """Forget all queued snapshots and remove the journal."""
+        self._entries = {}
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
 
 ###############################################################################
-# UTILITIES
+# BATCH PROCESSING WITH CHECKPOINTING
 ###############################################################################
 
-def ensure_dir_exists(path):
-    """Create directory if it doesn't exist."""
+def _load_log_lines(path):
+    """
+    Complete lines of an append-only log, truncating a torn last line.
+
+    A crash can leave the final line half-written; it is cut off so that
+    the next append starts on a fresh line.
+    """
     if not os.path.exists(path):
-        os.makedirs(path, exist_ok=True)
+        return []
+    lines = []
+    complete_bytes = 0
+    with open(path, 'rb') as f:
+        for line in f:
+            if not line.endswith(b'\n'):
+                break
+            complete_bytes += len(line)
+            lines.append(line.decode('utf-8').rstrip('\n'))
+    if complete_bytes < os.path.getsize(path):
+        os.truncate(path, complete_bytes)
+    return lines
 
 
-###############################################################################
-# WAYBACK SNAPSHOT FUNCTIONS
-###############################################################################
+def _append_log_line(f, line):
+    """Append one line to an open log and force it to disk."""
+    _append_log_lines(f, [line])
 
-def get_cdx_snapshots(url, user_agent='ResearchScraper/1.0', limit=None,
-                      from_timestamp=None, to_timestamp=None, timeout=30):
+
+def _append_log_lines(f, lines):
+    """Append lines to an open log in one write and force them to disk."""
+    f.write(''.join(line + '\n' for line in lines))
+    f.flush()
+    os.fsync(f.fileno())
+
+
+def _run_key(from_timestamp, to_timestamp, max_snapshots, signals):
+    """Run parameters a checkpoint or journal is only valid for."""
+    return {'from_timestamp': from_timestamp, 'to_timestamp': to_timestamp,
+            'max_snapshots': max_snapshots, 'signals': sorted(signals)}
+
+
+class DomainCheckpoint:
     """
-    Fetch Wayback Machine snapshots for a given URL using the CDX API.
-    
-    Args:
-        url: Target URL to find snapshots for
-        user_agent: User-agent string for API requests
-        limit: Maximum number of snapshots to retrieve
-        from_timestamp: Start date (format: YYYYMMDDHHMMSS)
-        to_timestamp: End date (format: YYYYMMDDHHMMSS)
-        timeout: Request timeout in seconds
-    
-    Returns:
-        List of snapshot dictionaries with 'timestamp' and 'original' keys
+    Set of finished domains, persisted as an append-only log.
+
+    Domains are keyed by their normalized form (see _normalize_domain), so
+    re-sorting, deduplicating or extending the input CSV between runs never
+    shifts the resume point: domains already in the set are skipped and only
+    new ones are scraped. Membership checks are O(1).
+
+    Domains are also keyed by ``run`` (see _run_key): a ``#run`` line starts
+    the domains finished under given run parameters, and only the domains
+    recorded under the current ones count. A run with another window or
+    signal set therefore scrapes every domain again.
     """
-    api_url = 'https://web.archive.org/cdx/search/cdx'
-    params = {
-        'url': url,
-        'output': 'json',
-        'fl': 'timestamp,original',
-        'collapse': 'timestamp:8'  # Collapse to daily snapshots
-    }
 
-    if limit:
-        params['limit'] = limit
-    if from_timestamp:
-        params['from'] = from_timestamp
-    if to_timestamp:
-        params['to'] = to_timestamp
+    def __init__(self, path, run=None):
+        self.path = path
+        self._lock = threading.Lock()
+        self._done = set()
+        run_line = self._run_line(run)
+        section = None
+        other_runs = legacy = 0
+        for line in _load_log_lines(path):
+            if line.startswith('#run\t'):
+                section = line
+            elif not line:
+                continue
+            elif line.isdigit():
+                # A bare number is a row-index checkpoint written by older versions
+                legacy += 1
+            elif section == run_line:
+                self._done.add(line)
+            else:
+                other_runs += 1
+        if legacy:
+            print(f"Ignoring row-index checkpoint in {path}")
+        if other_runs:
+            print(f"Ignoring {other_runs} domains checkpointed with other run parameters")
 
-    headers = {'User-Agent': user_agent}
+        self._file = open(path, 'a', encoding='utf-8')
+        if run_line is not None and section != run_line:
+            _append_log_line(self._file, run_line)
 
-    try:
-        r = requests.get(api_url, params=params, headers=headers, timeout=timeout)
-        r.raise_for_status()
-    except Timeout:
-        print(f"  CDX API timeout for {url}")
-        return []
-    except RequestException as e:
-        print(f"  CDX API error for {url}: {e}")
-        return []
+    @staticmethod
+    def _run_line(run):
+        return None if run is None else f"#run\t{json.dumps(run, sort_keys=True)}"
 
-    try:
-        results = r.json()
-    except Exception as e:
-        print(f"  JSON parsing error for {url}: {e}")
-        return []
+    def __contains__(self, domain):
+        return _normalize_domain(domain) in self._done
 
-    if len(results) <= 1:
-        return []
+    @property
+    def domains(self):
+        """Normalized domains already finished."""
+        return frozenset(self._done)
+
+    def __len__(self):
+        return len(self._done)
 
-    keys = results[0]
-    snapshots = [dict(zip(keys, entry)) for entry in results[1:]]
-    snapshots = [s for s in snapshots if 'timestamp' in s and 'original' in s]
+    def add(self, domain):
+        """Durably mark a domain as finished."""
+        self.add_many([domain])
 
-    return snapshots
+    def add_many(self, domains):
+        """Durably mark several domains as finished with one fsync."""
+        with self._lock:
+            keys = [key for key in dict.fromkeys(map(_normalize_domain, domains))
+                    if key not in self._done]
+            if keys:
+                _append_log_lines(self._file, keys)
+                self._done.update(keys)
 
+    def close(self):
+        self._file.close()
 
-def download_wayback(url, timestamp, user_agent='ResearchScraper/1.0', timeout=30):
+
+class SnapshotProgressJournal:
     """
-    Download a specific snapshot from the Wayback Machine.
-    
-    Args:
-        url: Original URL to retrieve
-        timestamp: Wayback timestamp (YYYYMMDDHHMMSS format)
-        user_agent: User-agent for the request
-        timeout: Request timeout in seconds
-    
-    Returns:
-        requests.Response object
+    Append-only commit log of the (domain, timestamp) snapshots handled.
+
+    Each output flush is committed with one append: a tab-separated line
+    per snapshot whose row was flushed (or handed to the retry queue), a
+    line per retried snapshot written, and a final ``#commit`` line holding
+    the output's commit state (see CsvOutput.commit_state). Only entries
+    followed by a commit line count; a crash mid-append leaves entries
+    without one, which are truncated away on load. A resumed run rolls
+    the output back to ``last_commit`` and skips exactly the committed
+    snapshots, so no row is lost or written twice. Commit lines also carry
+    the ``run`` parameters (see _run_key) the journal was written under.
     """
-    archive_url = f'https://web.archive.org/web/{timestamp}id_/{url}'
-    headers = {'User-Agent': user_agent}
-    return requests.get(archive_url, headers=headers, timeout=timeout)
 
+    def __init__(self, path, run=None):
+        self.path = path
+        self.run = run
+        self._done = {}
+        self._retried = set()
+        self.last_commit = None
+        self._lock = threading.Lock()
 
-def parse_robots_txt(text):
+        snapshots, retried = [], []
+        committed_bytes = end = 0
+        for line in _load_log_lines(path):
+            end += len(line.encode('utf-8')) + 1
+            fields = line.split('\t')
+            if fields[0] == '#commit':
+                self.last_commit = json.loads(fields[1])
+                for key, timestamp in snapshots:
+                    self._done.setdefault(key, set()).add(timestamp)
+                self._retried.update(retried)
+                snapshots, retried = [], []
+                committed_bytes = end
+            elif len(fields) == 2:
+                snapshots.append((fields[0], fields[1]))
+            elif len(fields) == 3 and fields[2] == 'retried':
+                retried.append((fields[0], fields[1]))
+
+        if self.last_commit is None:
+            # Journals written before commit lines existed: every entry counts
+            for key, timestamp in snapshots:
+                self._done.setdefault(key, set()).add(timestamp)
+        elif committed_bytes < end:
+            print(f"Discarding {len(snapshots)} uncommitted journal entries")
+            os.truncate(path, committed_bytes)
+        if self._done:
+            print(f"Loaded {len(self)} journaled snapshots")
+
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def __len__(self):
+        return sum(len(timestamps) for timestamps in self._done.values())
+
+    def done(self, domain):
+        """Timestamps of ``domain`` already handled."""
+        with self._lock:
+            return frozenset(self._done.get(_normalize_domain(domain), ()))
+
+    def awaiting_retry(self, domain, timestamp):
+        """Whether a snapshot is in the retry queue and not retried yet."""
+        key = _normalize_domain(domain)
+        with self._lock:
+            return (timestamp in self._done.get(key, ())
+                    and (key, timestamp) not in self._retried)
+
+    def record(self, domain, timestamp):
+        """Durably mark one snapshot as handled."""
+        self.record_many([(domain, timestamp)])
+
+    def record_many(self, snapshots, retried=(), output_state=None):
+        """
+        Commit several snapshots with one append and fsync.
+
+        Args:
+            snapshots: (domain, timestamp) pairs whose rows were flushed or
+                queued for retry
+            retried: (domain, timestamp) pairs whose retried rows were flushed
+            output_state: The output's commit_state() after the flush
+        """
+        entries = [(_normalize_domain(domain), timestamp) for domain, timestamp in snapshots]
+        retried = [(_normalize_domain(domain), timestamp) for domain, timestamp in retried]
+        commit = {'output': output_state, 'run': self.run}
+        with self._lock:
+            _append_log_lines(self._file,
+                              [f"{key}\t{timestamp}" for key, timestamp in entries]
+                              + [f"{key}\t{timestamp}\tretried" for key, timestamp in retried]
+                              + [f"#commit\t{json.dumps(commit)}"])
+            for key, timestamp in entries:
+                self._done.setdefault(key, set()).add(timestamp)
+            self._retried.update(retried)
+            self.last_commit = commit
+
+    def close(self):
+        self._file.close()
+
+    def clear(self):
+        """Forget all progress and remove the journal."""
+        self.close()
+        self._done = {}
+        self._retried = set()
+        self.last_commit = None
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class _SnapshotRowSink:
     """
-    Parse robots.txt content into structured rules.
-    
-    Args:
-        text: Raw robots.txt content
-    
-    Returns:
-        Dictionary mapping user-agents to their rules
+    Hands finished snapshot rows to the output, from any worker.
+
+    Transiently failed rows go to the retry queue instead of the output.
+    The output buffers rows and is flushed once ``output.flush_rows`` rows
+    are pending or the oldest of them has waited ``flush_interval`` seconds
+    (None: by size only). Each flush is then committed to the journal
+    together with the output's commit state, and finished domains are
+    checkpointed after that, so a crash never marks unwritten rows as done
+    and a resumed run rolls back rows written after the last commit.
     """
-    rules = {}
-    current_agent = None
 
-    for line in text.split('\n'):
-        line = line.strip()
-        if not line or line.startswith('#'):
-            continue
+    def __init__(self, output, journal, checkpoint, retry_queue, stats,
+                 blob_store=None, flush_interval=None):
+        self.output = output
+        self.blob_store = blob_store
+        self.journal = journal
+        self.checkpoint = checkpoint
+        self.retry_queue = retry_queue
+        self.stats = stats
+        self._lock = threading.Lock()
+        self.flush_interval = flush_interval
+        self._pending_snapshots = []
+        self._pending_retried = []
+        self._pending_domains = []
+        self._pending_since = None
 
-        if line.lower().startswith('user-agent:'):
-            current_agent = line.split(':', 1)[1].strip()
-            rules[current_agent] = []
-        elif current_agent:
-            rules[current_agent].append(line)
+    def __call__(self, row):
+        with self._lock:
+            df = self.retry_queue.defer_transient(pd.DataFrame([row]))
+            if not df.empty:
+                self._write(df)
+                self.stats['snapshots'] += 1
+            self._pending_snapshots.append((row['domain'], row['timestamp']))
+            self._commit()
 
-    return rules
+    def write_retried(self, df):
+        """Write the rows the retry queue re-fetched and commit them."""
+        with self._lock:
+            self._write(df)
+            self.stats['snapshots'] += len(df)
+            self._pending_retried.extend(zip(df['domain'], df['timestamp']))
+            self._commit(force=True)
 
+    def _write(self, df):
+        if self.blob_store is not None:
+            df = _store_robots_bodies(df, self.blob_store)
+        if not self.output.pending_rows:
+            self._pending_since = time.monotonic()
+        self.output.write(df)
 
-def is_html(text):
-    """Check if text content is HTML rather than plain text."""
-    try:
-        return bool(BeautifulSoup(text, 'html.parser').find())
-    except Exception:
-        return False
+    def finish_domain(self, domain):
+        """Checkpoint a domain once its rows are durably written."""
+        with self._lock:
+            self._pending_domains.append(domain)
+            self._commit()
 
+    def _commit(self, force=False):
+        pending = self.output.pending_rows
+        overdue = (pending and self.flush_interval is not None
+                   and time.monotonic() - self._pending_since >= self.flush_interval)
+        if pending and not (force or overdue or pending >= self.output.flush_rows):
+            return
+        self.output.flush()
+        if self._pending_snapshots or self._pending_retried:
+            self.journal.record_many(self._pending_snapshots, retried=self._pending_retried,
+                                     output_state=self.output.commit_state())
+        self.checkpoint.add_many(self._pending_domains)
+        self._pending_snapshots = []
+        self._pending_retried = []
+        self._pending_domains = []
 
-def extract_meta_robots(html_text):
-    """Extract meta robots tag content from HTML."""
-    try:
-        soup = BeautifulSoup(html_text, 'html.parser')
-        meta = soup.find('meta', attrs={'name': 'robots'})
-        if meta and 'content' in meta.attrs:
-            return meta['content'].lower()
-    except Exception:
-        pass
-    return None
+    def close(self):
+        """Flush buffered rows and commit their progress."""
+        with self._lock:
+            self._commit(force=True)
+            self.output.close()
 
 
-def extract_x_robots_tag(headers):
-    """Extract X-Robots-Tag from HTTP headers."""
-    for key, value in headers.items():
-        if key.lower() == 'x-robots-tag':
-            return value.lower()
-    return None
+def _scrape_domain(domain, sink, snapshot_lists, scrape_kwargs):
+    """
+    Scrape the snapshots of a domain that are not journaled yet.
 
+    Returns:
+        (DataFrame of the new rows, number of snapshots already journaled)
+    """
+    snapshots = snapshot_lists.get(domain)
+    if snapshots is None:
+        # Unlike get_cdx_snapshots this raises on failures, so that only a
+        # real empty answer counts as a domain without snapshots
+        snapshots = _lookup_cdx_snapshots(
+            f'{domain}/robots.txt', limit=scrape_kwargs['max_snapshots'],
+            from_timestamp=scrape_kwargs['from_timestamp'],
+            to_timestamp=scrape_kwargs['to_timestamp'],
+            session=scrape_kwargs['session']
+        )
+    skip = sink.journal.done(domain)
+    df = scrape_robots_and_signals(domain, snapshots=snapshots,
+                                   skip_timestamps=skip, on_row=sink, **scrape_kwargs)
+    return df, len(skip)
 
-###############################################################################
-# MAIN SCRAPER
-###############################################################################
 
-def scrape_robots_and_signals(domain, max_snapshots=50,
-                              from_timestamp=None, to_timestamp=None,
-                              timeout=30):
+def build_work_list(domains, done=(), shard_index=0, num_shards=1):
     """
-    Scrape historical robots.txt and web governance signals for a domain.
-    
-    This function:
-    1. Fetches Wayback snapshots of robots.txt
-    2. Downloads and parses each snapshot
-    3. Also checks homepage for meta robots and X-Robots-Tag
-    
+    Turn a raw domain column into the list of domains still to scrape.
+
+    Normalization (scheme, whitespace and trailing slashes stripped,
+    lower-cased), validation, deduplication and the finished-domain filter
+    run as whole-column operations, so million-row inputs prepare in
+    seconds. Only the shard filter hashes each distinct domain in Python.
+
     Args:
-        domain: Domain to scrape (e.g., 'example.com')
-        max_snapshots: Maximum number of snapshots to process
-        from_timestamp: Start date (YYYYMMDDHHMMSS)
-        to_timestamp: End date (YYYYMMDDHHMMSS)
-        timeout: Request timeout in seconds
-    
+        domains: pandas Series of raw domains (e.g. the CSV 'domain' column)
+        done: Collection of normalized domains already finished
+        shard_index, num_shards: Keep only this shard (see shard_of)
+
     Returns:
-        pandas DataFrame with schema matching ROBOTS_SCRAPE_SCHEMA
+        List of (row index, normalized domain) pairs, first occurrence only
     """
-    # Clean and validate domain
-    clean_domain = domain.replace('http://', '').replace('https://', '').strip().strip('/')
-    if not clean_domain:
-        return pd.DataFrame()
-    
-    robots_url = f'{clean_domain}/robots.txt'
-    user_agent = 'ResearchScraper/1.0'
+    normalized = (domains.astype('string')
+                  .str.replace(_SCHEME_RE, '', regex=True)
+                  .str.strip().str.strip('/').str.lower())
 
-    snapshots = get_cdx_snapshots(
-        robots_url,
-        user_agent=user_agent,
-        limit=max_snapshots,
-        from_timestamp=from_timestamp,
-        to_timestamp=to_timestamp,
-        timeout=timeout
-    )
+    valid = normalized.str.fullmatch(_DOMAIN_RE).fillna(False).astype(bool)
+    invalid = (~valid & normalized.fillna('').ne('')).sum()
+    if invalid:
+        print(f"Skipping {invalid} malformed domains")
 
-    if not snapshots:
-        return pd.DataFrame()
+    normalized = normalized[valid & ~normalized.duplicated() & ~normalized.isin(list(done))]
+    if num_shards > 1:
+        in_shard = [shard_of(d, num_shards) == shard_index for d in normalized]
+        normalized = normalized[in_shard]
 
-    data = []
+    return list(zip(normalized.index, normalized.tolist()))
 
-    for snap in snapshots:
-        timestamp = snap['timestamp']
-        original_url = snap['original']
-
-        robots_text = None
-        raw_robots_response_text = None
-        robots_rules = {}
-        robots_content_type = 'unknown'
-        meta_robots = None
-        x_robots_tag = None
-        status_robots = None
-        status_home = None
-        error_details = None
+
+def _record_domain_result(df, already_done, domain, error_log_file, stats):
+    """Update stats for a domain whose rows the sink has written."""
+    if df.empty:
+        if already_done:
+            print(f"  ✓ All {already_done} snapshots already written")
+            stats['success'] += 1
+            return
+        print(f"  ⚠ No snapshots found")
+        stats['fail'] += 1
+        _log_domain_error(error_log_file, domain, "No snapshots")
+        return
+
+    stats['success'] += 1
+    print(f"  ✓ Scraped {len(df)} snapshots (Total written: {stats['snapshots']})")
+
+
+def _scrape_domains_serially(work, total, error_log_file, sink,
+                             stats, scrape_kwargs, snapshot_lists):
+    """Scrape (index, domain) pairs one at a time."""
+    for index, domain in work:
+        print(f"\n### [{index+1}/{total}] Scraping: {domain} ###")
 
         try:
-            # ------------------ ROBOTS.TXT
-            resp_robots = download_wayback(original_url, timestamp, user_agent, timeout)
-            status_robots = resp_robots.status_code
-
-            if status_robots == 200:
-                raw_robots_response_text = resp_robots.text
-                if is_html(raw_robots_response_text):
-                    robots_text = "HTML Content (Not robots.txt)"
-                    robots_content_type = "HTML_page"
-                else:
-                    robots_text = raw_robots_response_text
-                    robots_rules = parse_robots_txt(robots_text)
-                    robots_content_type = "robots.txt"
-            else:
-                robots_content_type = f"HTTP_Error_{status_robots}"
-
-            # ------------------ HOMEPAGE
-            home_url = f'http://{clean_domain}'
-            resp_home = download_wayback(home_url, timestamp, user_agent, timeout)
-            status_home = resp_home.status_code
-
-            if status_home == 200:
-                meta_robots = extract_meta_robots(resp_home.text)
-                x_robots_tag = extract_x_robots_tag(resp_home.headers)
-
-        except Timeout:
-            error_details = "Timeout"
-        except ConnectionError:
-            error_details = "ConnectionError"
-        except RequestException as e:
-            error_details = f"RequestException: {str(e)[:100]}"
+            df, already_done = _scrape_domain(domain, sink, snapshot_lists, scrape_kwargs)
+            _record_domain_result(df, already_done, domain, error_log_file, stats)
+            sink.finish_domain(domain)
+                
         except Exception as e:
-            error_details = f"GeneralError: {str(e)[:100]}"
-
-        data.append({
-            "domain": domain,
-            "timestamp": timestamp,
-            "scraped_url": original_url,
-            "robots_txt": robots_text,
-            "raw_robots_response_text": raw_robots_response_text,
-            "robots_content_type": robots_content_type,
-            "robots_rules": json.dumps(robots_rules) if robots_rules else None,
-            "meta_robots": meta_robots,
-            "x_robots_tag": x_robots_tag,
-            "status_robots": status_robots,
-            "status_home": status_home,
-            "error_details": error_details
-        })
+            print(f"  ✗ Error: {e}")
+            stats['fail'] += 1
+            _log_domain_error(error_log_file, domain, str(e))
 
-        time.sleep(2)  # Respectful rate limiting
 
-    return pd.DataFrame(data)
+def _scrape_domains_concurrently(work, total, error_log_file, sink,
+                                 stats, max_workers, scrape_kwargs, snapshot_lists):
+    """
+    Scrape (index, domain) pairs with a bounded worker pool.
 
+    Workers fetch and hand finished rows to the sink; stats and the
+    checkpoint are updated from the calling thread as each domain finishes,
+    in whatever order that happens.
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(_scrape_domain, domain, sink, snapshot_lists,
+                            scrape_kwargs): (index, domain)
+            for index, domain in work
+        }
+
+        for future in as_completed(futures):
+            index, domain = futures[future]
+            print(f"\n### [{index+1}/{total}] Scraped: {domain} ###")
+
+            try:
+                df, already_done = future.result()
+                _record_domain_result(df, already_done, domain, error_log_file, stats)
+                sink.finish_domain(domain)
+
+            except Exception as e:
+                print(f"  ✗ Error: {e}")
+                stats['fail'] += 1
+                _log_domain_error(error_log_file, domain, str(e))
 
-###############################################################################
-# BATCH PROCESSING WITH CHECKPOINTING
-###############################################################################
 
 def batch_scrape_domains(input_csv_path, output_csv, 
                         checkpoint_file="scraping_checkpoint.txt",
                         error_log_file="scraping_errors.txt",
                         max_snapshots=30,
                         from_timestamp='20220101000000',
-                        to_timestamp='20240101000000'):
+                        to_timestamp='20240101000000',
+                        max_workers=1,
+                        cdx_rate=DEFAULT_CDX_RATE,
+                        snapshot_rate=DEFAULT_SNAPSHOT_RATE,
+                        rate_ceiling_factor=None,
+                        pool_size=None,
+                        retry_queue_file="scraping_retry_queue.jsonl",
+                        max_retry_attempts=3,
+                        cache_dir=None,
+                        cache_max_bytes=DEFAULT_CACHE_MAX_BYTES,
+                        cdx_cache_dir=None,
+                        offline=False,
+                        bulk_cdx=False,
+                        resolve_homepages=True,
+                        changes_only=False,
+                        homepage_fetch='partial',
+                        signals=ALL_SIGNALS,
+                        shard_index=0,
+                        num_shards=1,
+                        progress_journal_file="scraping_progress.log",
+                        output_format='csv',
+                        flush_rows=None,
+                        flush_interval=None,
+                        robots_blob_dir=None,
+                        response_archive_file=None):
     """
     Scrape multiple domains from CSV with checkpointing and error recovery.
     
     Args:
         input_csv_path: Path to CSV with 'domain' column
-        output_csv: Path to output CSV (will be created/appended)
-        checkpoint_file: File to track progress
+        output_csv: Path to output CSV (will be created/appended), the
+            directory of part files for Parquet output, or the database
+            file for SQLite output
+        checkpoint_file: Log of finished domains (see DomainCheckpoint);
+            kept after the run so a grown domain list only scrapes new
+            domains; delete it to scrape everything again
         error_log_file: File to log errors
         max_snapshots: Max snapshots per domain
         from_timestamp: Start date filter
         to_timestamp: End date filter
+        max_workers: Number of domains scraped at once
+        cdx_rate: Global CDX queries per second, shared by all workers
+        snapshot_rate: Global snapshot downloads per second, shared by all
+            workers
+        rate_ceiling_factor: Highest rate adaptive backoff probes, as a
+            multiple of cdx_rate and snapshot_rate (RATE_CEILING_FACTOR if None)
+        pool_size: Keep-alive connections to the archive (defaults to
+            max(max_workers, DEFAULT_POOL_SIZE))
+        retry_queue_file: Journal of snapshots that failed with a timeout or
+            connection error; they are re-fetched at the end of the batch
+        max_retry_attempts: Re-fetch attempts per (domain, timestamp)
+        cache_dir: Directory of the on-disk snapshot cache (None disables it)
+        cache_max_bytes: Cache size above which LRU entries are evicted
+        cdx_cache_dir: Directory of the CDX index cache (None disables it)
+        offline: Answer from the caches only, never contacting the archive
+        bulk_cdx: Fetch all snapshot lists up front, one query per group of
+            domains sharing a registrable domain (see get_cdx_snapshots_bulk)
+        resolve_homepages: Download each distinct homepage capture once per
+            domain (see resolve_homepage_captures)
+        changes_only: Download one robots.txt body per distinct CDX digest
+            of a domain; every snapshot still gets its own row
+        homepage_fetch: 'partial', 'headers' or 'full' (see
+            scrape_robots_and_signals); 'headers' collects X-Robots-Tag
+            without any homepage body transfer
+        signals: Signals to collect, a subset of {'robots', 'meta',
+            'xrobots'}; e.g. {'robots'} skips every homepage fetch
+        shard_index: Shard of the domain list to scrape (see shard_of);
+            give each shard its own output, checkpoint, error and retry files
+        num_shards: Number of shards the domain list is split into
+        progress_journal_file: Append-only log of the snapshots already
+            written; a resumed run skips exactly those (see
+            SnapshotProgressJournal)
+        output_format: 'csv' (one appended file), 'parquet' (zstd part
+            files with dictionary-encoded domain and content type; needs
+            pyarrow) or 'sqlite' (database file with one upserted row per
+            snapshot)
+        flush_rows: Rows buffered before they are written in one go: per
+            CSV append, Parquet part file or SQLite transaction (None: the
+            format's default)
+        flush_interval: Seconds after which buffered rows are written even
+            if fewer than flush_rows are pending (None: the format's default,
+            60 for CSV and SQLite; Parquet parts are written by size only)
+        robots_blob_dir: Directory of a RobotsBlobStore; when set, robots.txt
+            bodies are stored there once per distinct content and rows keep
+            only robots_hash (None: bodies stay in the rows)
+        response_archive_file: Path of a ResponseArchive (WARC) that keeps
+            every downloaded response, e.g. 'data/responses.warc.gz'
+            (None: responses are not archived)
     """
     # Read domains
     try:
@@ -321,84 +3160,288 @@ def batch_scrape_domains(input_csv_path, output_csv,
         print("ERROR: 'domain' column missing")
         return
 
-    # Load checkpoint if exists
-    start_index = 0
-    if os.path.exists(checkpoint_file):
-        with open(checkpoint_file, 'r') as f:
-            try:
-                start_index = int(f.read().strip())
-                print(f"Resuming from domain index {start_index}")
-            except ValueError:
-                print("Invalid checkpoint, starting from beginning")
+    if offline and not (cache_dir and cdx_cache_dir):
+        print("ERROR: offline mode needs cache_dir and cdx_cache_dir")
+        return
 
-    csv_exists = os.path.exists(output_csv)
-    
-    success_count = 0
-    fail_count = 0
-    total_snapshots = 0
+    try:
+        _check_signals(signals, homepage_fetch)
+    except ValueError as e:
+        print(f"ERROR: {e}")
+        return
 
-    for index, row in domains_df.iterrows():
-        if index < start_index:
-            continue
-            
-        domain = str(row["domain"]).strip()
-        if domain == "" or pd.isna(domain):
-            continue
+    if not 0 <= shard_index < num_shards:
+        print(f"ERROR: shard_index must be in [0, {num_shards})")
+        return
 
-        print(f"\n### [{index+1}/{len(domains_df)}] Scraping: {domain} ###")
+    try:
+        output = _open_output(output_csv, output_format, flush_rows)
+    except (ValueError, ImportError, sqlite3.Error) as e:
+        print(f"ERROR: {e}")
+        return
 
-        try:
-            df = scrape_robots_and_signals(
-                domain, 
-                max_snapshots=max_snapshots,
+    set_rate_limits(cdx_rate=cdx_rate, snapshot_rate=snapshot_rate,
+                    ceiling_factor=rate_ceiling_factor)
+
+    run = _run_key(from_timestamp, to_timestamp, max_snapshots, signals)
+    checkpoint = DomainCheckpoint(checkpoint_file, run=run)
+    if len(checkpoint):
+        print(f"Resuming: {len(checkpoint)} domains already finished")
+
+    work = build_work_list(domains_df["domain"], done=checkpoint.domains,
+                           shard_index=shard_index, num_shards=num_shards)
+
+    session = create_session(pool_size or max(max_workers, DEFAULT_POOL_SIZE))
+    response_archive = ResponseArchive(response_archive_file) if response_archive_file else None
+    scrape_kwargs = dict(
+        max_snapshots=max_snapshots,
+        from_timestamp=from_timestamp,
+        to_timestamp=to_timestamp,
+        session=session,
+        resolve_homepages=resolve_homepages,
+        changes_only=changes_only,
+        homepage_fetch=homepage_fetch,
+        signals=signals,
+        response_archive=response_archive
+    )
+
+    retry_queue = SnapshotRetryQueue(retry_queue_file, max_attempts=max_retry_attempts)
+    stats = dict(success=0, fail=0, snapshots=0)
+    journal = SnapshotProgressJournal(progress_journal_file, run=run)
+    previous_run = journal.last_commit and journal.last_commit.get('run')
+    if previous_run and previous_run != journal.run:
+        print(f"ERROR: {progress_journal_file} belongs to an unfinished run with "
+              f"other parameters ({previous_run}); finish it or delete the journal")
+        journal.close()
+        checkpoint.close()
+        output.close()
+        return
+
+    # Undo output written after the last commit, and retry entries it did
+    # not commit (or whose retried rows it already committed)
+    if journal.last_commit is not None:
+        output.rollback(journal.last_commit['output'])
+    else:
+        journal.record_many([], output_state=output.commit_state())
+    retry_queue.retain(journal.awaiting_retry)
+    blob_store = RobotsBlobStore(robots_blob_dir) if robots_blob_dir else None
+    if flush_interval is None:
+        flush_interval = DEFAULT_FLUSH_INTERVALS[output_format]
+    sink = _SnapshotRowSink(output, journal, checkpoint, retry_queue, stats,
+                            blob_store=blob_store, flush_interval=flush_interval)
+
+    # The caches are module-wide; the ones in use before are restored below
+    previous_caches = (_snapshot_cache, _cdx_cache)
+    set_snapshot_cache(SnapshotCache(cache_dir, max_bytes=cache_max_bytes, offline=offline)
+                       if cache_dir else None)
+    set_cdx_cache(CdxIndexCache(cdx_cache_dir, offline=offline) if cdx_cache_dir else None)
+
+    try:
+        snapshot_lists = {}
+        if bulk_cdx:
+            print(f">>> Bulk CDX lookup for {len(work)} domains")
+            snapshot_lists = get_cdx_snapshots_bulk(
+                [domain for _, domain in work],
+                limit=max_snapshots,
                 from_timestamp=from_timestamp,
-                to_timestamp=to_timestamp
+                to_timestamp=to_timestamp,
+                session=session
             )
-            
-            if not df.empty:
-                df['datetime'] = pd.to_datetime(
-                    df['timestamp'],
-                    format='%Y%m%d%H%M%S',
-                    errors='coerce'
-                )
-                
-                mode = 'a' if csv_exists else 'w'
-                with open(output_csv, mode, encoding='utf-8', newline='') as f:
-                    df.to_csv(
-                        f, 
-                        mode=mode,
-                        index=False, 
-                        header=not csv_exists,
-                        encoding='utf-8'
-                    )
-                csv_exists = True
-                total_snapshots += len(df)
-                success_count += 1
-                print(f"  ✓ Wrote {len(df)} snapshots (Total: {total_snapshots})")
-            else:
-                print(f"  ⚠ No snapshots found")
-                fail_count += 1
-                with open(error_log_file, 'a') as err_log:
-                    err_log.write(f"{domain}: No snapshots\n")
-                
-        except Exception as e:
-            print(f"  ✗ Error: {e}")
-            fail_count += 1
-            with open(error_log_file, 'a') as err_log:
-                err_log.write(f"{domain}: {str(e)}\n")
 
-        # Update checkpoint
-        with open(checkpoint_file, 'w') as f:
-            f.write(str(index + 1))
+        if max_workers > 1:
+            _scrape_domains_concurrently(
+                work, len(domains_df), error_log_file, sink,
+                stats, max_workers, scrape_kwargs, snapshot_lists
+            )
+        else:
+            _scrape_domains_serially(
+                work, len(domains_df), error_log_file, sink,
+                stats, scrape_kwargs, snapshot_lists
+            )
 
-        time.sleep(10 + random.uniform(0, 5))  # Rate limiting
+        # Re-fetch only the snapshots that failed transiently
+        if len(retry_queue):
+            retried = retry_queue.drain(session=session, max_workers=max_workers,
+                                        homepage_fetch=homepage_fetch, signals=signals,
+                                        response_archive=response_archive)
+            recovered = (~retried['error_details'].isin(TRANSIENT_ERRORS)).sum()
+            sink.write_retried(retried)
+            retry_queue.clear()
+            print(f">>> Recovered {recovered}/{len(retried)} snapshots on retry")
+    finally:
+        set_snapshot_cache(previous_caches[0])
+        set_cdx_cache(previous_caches[1])
+        session.close()
+        if response_archive is not None:
+            response_archive.close()
+        sink.close()
+        journal.close()
+        checkpoint.close()
 
     print(f"\n>>> Scraping complete!")
-    print(f">>> Successful: {success_count}, Failed: {fail_count}")
-    print(f">>> Total snapshots: {total_snapshots}")
+    print(f">>> Successful: {stats['success']}, Failed: {stats['fail']}")
+    print(f">>> Total snapshots: {stats['snapshots']}")
+
+    journal.clear()
+
+
+###############################################################################
+# SHARDED RUNS
+###############################################################################
+
+def shard_of(domain, num_shards):
+    """
+    Shard a domain belongs to, stable across processes and machines.
+
+    Based on the SHA-1 of the cleaned, lower-cased domain, so every run with
+    the same ``num_shards`` assigns a domain to the same shard whatever the
+    input order.
+    """
+    key = _normalize_domain(domain).encode('utf-8')
+    return int.from_bytes(hashlib.sha1(key).digest()[:8], 'big') % num_shards
+
+
+def shard_paths(output_dir, shard_index, num_shards):
+    """Output part, checkpoint, error, retry and journal files of a shard."""
+    suffix = f"part-{shard_index:05d}-of-{num_shards:05d}"
+    return dict(
+        output_csv=os.path.join(output_dir, f"robots_{suffix}.csv"),
+        checkpoint_file=os.path.join(output_dir, f"checkpoint_{suffix}.txt"),
+        error_log_file=os.path.join(output_dir, f"errors_{suffix}.txt"),
+        retry_queue_file=os.path.join(output_dir, f"retry_queue_{suffix}.jsonl"),
+        progress_journal_file=os.path.join(output_dir, f"progress_{suffix}.log"),
+    )
+
+
+def _shard_file(path, shard_index, num_shards):
+    """``path`` with the shard suffix inserted before its extensions."""
+    directory, name = os.path.split(path)
+    stem, dot, extensions = name.partition('.')
+    suffix = f"part-{shard_index:05d}-of-{num_shards:05d}"
+    return os.path.join(directory, f"{stem}_{suffix}{dot}{extensions}")
+
+
+def run_sharded_scrape(input_csv_path, output_dir, num_shards,
+                       processes=None, shards=None, **batch_kwargs):
+    """
+    Scrape a domain list as independent shards in parallel processes.
+
+    Each shard runs batch_scrape_domains on its share of the domains (see
+    shard_of) with its own output part and checkpoint in ``output_dir``, so
+    an interrupted shard resumes on its own and shards can also be spread
+    across machines via ``shards``. Combine the parts with
+    merge_shard_outputs.
+
+    Rate limits apply per process: cdx_rate and snapshot_rate (in
+    ``batch_kwargs``) are divided among the processes, and adaptive backoff
+    may not probe above each process's share (rate_ceiling_factor=1 unless
+    given), so the processes of this call stay within the configured budget.
+    Calls on other machines (see ``shards``) each have a budget of their
+    own. A ``response_archive_file`` gets the shard suffix, so each process
+    appends to its own archive. Shard parts are always CSV, the only format
+    merge_shard_outputs reads.
+
+    Args:
+        input_csv_path: Path to CSV with 'domain' column
+        output_dir: Directory for the per-shard files
+        num_shards: Number of shards the domain list is split into
+        processes: Shards run at once (defaults to all shards)
+        shards: Shard indexes to run here (defaults to all)
+        **batch_kwargs: Passed to batch_scrape_domains
+
+    Raises:
+        ValueError: if ``batch_kwargs`` asks for an output_format other than
+            'csv'
+    """
+    if batch_kwargs.get('output_format', 'csv') != 'csv':
+        raise ValueError("run_sharded_scrape writes CSV parts only; "
+                         "convert the merged CSV afterwards")
+
+    ensure_dir_exists(output_dir)
+    shards = list(range(num_shards)) if shards is None else list(shards)
+    processes = min(processes or len(shards), len(shards))
+
+    batch_kwargs = dict(batch_kwargs)
+    for rate in ('cdx_rate', 'snapshot_rate'):
+        default = DEFAULT_CDX_RATE if rate == 'cdx_rate' else DEFAULT_SNAPSHOT_RATE
+        batch_kwargs[rate] = batch_kwargs.get(rate, default) / processes
+
+    batch_kwargs.setdefault('rate_ceiling_factor', 1.0)
+
+    archive = batch_kwargs.pop('response_archive_file', None)
+
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        futures = {
+            executor.submit(batch_scrape_domains, input_csv_path,
+                            shard_index=shard, num_shards=num_shards,
+                            response_archive_file=archive and _shard_file(
+                                archive, shard, num_shards),
+                            **shard_paths(output_dir, shard, num_shards),
+                            **batch_kwargs): shard
+            for shard in shards
+        }
+        for future in as_completed(futures):
+            future.result()
+            print(f">>> Shard {futures[future]} of {num_shards} finished")
+
+
+def _validate_robots_chunk(chunk, part):
+    """Problems of one chunk of an output part against ROBOTS_SCRAPE_SCHEMA."""
+    problems = []
+    if list(chunk.columns) != list(ROBOTS_SCRAPE_SCHEMA):
+        missing = set(ROBOTS_SCRAPE_SCHEMA) - set(chunk.columns)
+        extra = set(chunk.columns) - set(ROBOTS_SCRAPE_SCHEMA)
+        problems.append(f"{part}: columns differ from ROBOTS_SCRAPE_SCHEMA "
+                        f"(missing {sorted(missing)}, extra {sorted(extra)})")
+        return problems
+
+    if not chunk['timestamp'].str.fullmatch(r'\d{14}').all():
+        problems.append(f"{part}: timestamps that are not 14 digits")
+    for column in ('status_robots', 'status_home'):
+        values = chunk[column][chunk[column] != '']
+        if not values.str.fullmatch(r'\d+').all():
+            problems.append(f"{part}: non-integer values in {column}")
+    if (chunk['domain'] == '').any():
+        problems.append(f"{part}: rows without a domain")
+    return problems
+
+
+def merge_shard_outputs(output_dir, merged_csv, num_shards, chunksize=50000):
+    """
+    Validate the output parts of a sharded run and concatenate them.
+
+    Every part must have exactly the ROBOTS_SCRAPE_SCHEMA columns, 14-digit
+    timestamps and integer status codes. Parts are validated in chunks
+    and then copied byte for byte (minus their headers), so the merge needs
+    little memory and never alters a value. Shards without output rows are
+    skipped.
+
+    Raises:
+        ValueError listing every problem found; merged_csv is not written
+    """
+    parts = [shard_paths(output_dir, shard, num_shards)['output_csv']
+             for shard in range(num_shards)]
+    parts = [part for part in parts if os.path.exists(part) and os.path.getsize(part)]
+
+    # Read every cell as text: no float status codes, no text turned into NaN
+    read_kwargs = dict(dtype=str, keep_default_na=False, chunksize=chunksize)
+    problems = []
+    for part in parts:
+        for chunk in pd.read_csv(part, **read_kwargs):
+            problems.extend(_validate_robots_chunk(chunk, part))
+    if problems:
+        raise ValueError("Invalid shard outputs:\n" + "\n".join(problems))
 
-    if os.path.exists(checkpoint_file):
-        os.remove(checkpoint_file)
+    tmp_path = f"{merged_csv}.tmp"
+    with open(tmp_path, 'wb') as out:
+        for i, part in enumerate(parts):
+            with open(part, 'rb') as f:
+                header = f.readline()
+                if i == 0:
+                    out.write(header)
+                shutil.copyfileobj(f, out)
+    _replace_durably(tmp_path, merged_csv)
+    print(f">>> Merged {len(parts)} shard outputs into {merged_csv}")
 
 
 if __name__ == "__main__":
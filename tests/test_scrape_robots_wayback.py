@@ -0,0 +1,972 @@
+import asyncio
+import gzip
+import os
+import re
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import pytest
+import requests
+
+from src.data_collection import scrape_robots_wayback as scraper
+from src.data_collection.schema import ROBOTS_SCRAPE_SCHEMA
+
+
+def _record_sleeps(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(scraper.time, "sleep", sleeps.append)
+    return sleeps
+
+
+def test_token_bucket_allows_burst_without_waiting(monkeypatch):
+    sleeps = _record_sleeps(monkeypatch)
+    bucket = scraper.TokenBucket(rate=1, capacity=2)
+    bucket.acquire()
+    bucket.acquire()
+    assert sleeps == []
+
+
+def test_token_bucket_waits_once_budget_is_spent(monkeypatch):
+    sleeps = _record_sleeps(monkeypatch)
+    bucket = scraper.TokenBucket(rate=2, capacity=1)
+    bucket.acquire()
+    bucket.acquire()
+    assert len(sleeps) == 1
+    assert 0.4 < sleeps[0] <= 0.5
+
+
+def test_parse_retry_after_seconds_and_garbage():
+    assert scraper.parse_retry_after("120") == 120.0
+    assert scraper.parse_retry_after(None) is None
+    assert scraper.parse_retry_after("soon") is None
+
+
+def test_controller_halves_rate_and_honors_retry_after(monkeypatch):
+    sleeps = _record_sleeps(monkeypatch)
+    controller = scraper.AdaptiveRateController(scraper.TokenBucket(rate=1, capacity=1))
+    assert controller.on_throttled(retry_after=30) == 30
+    assert controller.bucket.rate == 0.5
+    controller.bucket.acquire()
+    controller.bucket.acquire()
+    assert sleeps and sleeps[0] >= 30
+
+
+def test_controller_probes_rate_back_up_to_ceiling():
+    controller = scraper.AdaptiveRateController(scraper.TokenBucket(rate=1, capacity=1))
+    for _ in range(1000):
+        controller.on_success()
+    assert controller.bucket.rate == controller.max_rate
+
+
+def test_controller_step_scales_with_rate_and_ceiling_can_cap_it():
+    controller = scraper.AdaptiveRateController(scraper.TokenBucket(rate=10, capacity=1))
+    controller.on_success()
+    assert controller.bucket.rate == 10 * (1 + scraper.RATE_INCREASE_FRACTION)
+
+    controller.reset(0.1, ceiling_factor=1)
+    controller.on_throttled(retry_after=0)
+    for _ in range(100):
+        controller.on_success()
+    assert controller.bucket.rate == 0.1
+
+
+def test_sharded_scrape_caps_each_process_at_its_share(monkeypatch, tmp_path):
+    calls = []
+    monkeypatch.setattr(scraper, "ProcessPoolExecutor", ThreadPoolExecutor)
+    monkeypatch.setattr(scraper, "batch_scrape_domains",
+                        lambda *args, **kwargs: calls.append(kwargs))
+
+    scraper.run_sharded_scrape(str(tmp_path / "in.csv"), str(tmp_path / "shards"),
+                               num_shards=4, processes=2, cdx_rate=1.0)
+    assert len(calls) == 4
+    assert {(c["cdx_rate"], c["snapshot_rate"], c["rate_ceiling_factor"])
+            for c in calls} == {(0.5, scraper.DEFAULT_SNAPSHOT_RATE / 2, 1.0)}
+
+
+def test_retry_queue_defers_transient_rows_and_survives_restart(tmp_path):
+    path = tmp_path / "retry.jsonl"
+    df = pd.DataFrame([
+        {"domain": "a.com", "timestamp": "20230101000000", "error_details": None},
+        {"domain": "a.com", "timestamp": "20230102000000", "error_details": "Timeout"},
+        {"domain": "a.com", "timestamp": "20230103000000", "error_details": "GeneralError: x"},
+    ])
+
+    remaining = scraper.SnapshotRetryQueue(str(path)).defer_transient(df)
+    assert list(remaining["timestamp"]) == ["20230101000000", "20230103000000"]
+    assert len(scraper.SnapshotRetryQueue(str(path))) == 1
+
+
+def _response(body, status=200):
+    resp = requests.Response()
+    resp.status_code = status
+    resp.headers["X-Robots-Tag"] = "noai"
+    resp.encoding = "utf-8"
+    resp.url = "https://web.archive.org/web/2023id_/http://a.com/"
+    resp._content = body
+    resp._content_consumed = True
+    return resp
+
+
+def test_snapshot_cache_round_trip(tmp_path):
+    cache = scraper.SnapshotCache(str(tmp_path))
+    assert cache.get("https://web.archive.org/web/1id_/a") is None
+
+    cache.put("https://web.archive.org/web/1id_/a", _response(b"User-agent: *"))
+    hit = scraper.SnapshotCache(str(tmp_path)).get("https://web.archive.org/web/1id_/a")
+    assert hit.status_code == 200
+    assert hit.text == "User-agent: *"
+    assert hit.headers["x-robots-tag"] == "noai"
+
+
+def test_snapshot_cache_evicts_least_recently_used(tmp_path):
+    cache = scraper.SnapshotCache(str(tmp_path), max_bytes=1500)
+    cache.put("old", _response(b"x" * 400))
+    cache.put("new", _response(b"y" * 400))
+    meta_old = cache._paths("old")[2]
+    os.utime(meta_old, (0, 0))
+
+    cache.put("newest", _response(b"z" * 400))
+    assert cache.get("old") is None
+    assert cache.get("newest") is not None
+
+
+class _FakeCdx:
+    """Answers CDX queries from a fixed list of daily timestamps."""
+
+    def __init__(self, days):
+        self.snapshots = [{"timestamp": d + "000000", "original": "a.com/robots.txt"}
+                          for d in days]
+        self.calls = []
+
+    def __call__(self, limit=None, from_timestamp=None, to_timestamp=None):
+        self.calls.append((limit, from_timestamp, to_timestamp))
+        lo = scraper._window_bound(from_timestamp, upper=False)
+        hi = scraper._window_bound(to_timestamp, upper=True)
+        found = [s for s in self.snapshots if lo <= s["timestamp"] <= hi]
+        return found[:limit] if limit else found
+
+
+def test_cdx_cache_only_queries_extended_part_of_window(tmp_path):
+    fetch = _FakeCdx(["20220301", "20230601", "20240201"])
+    cache = scraper.CdxIndexCache(str(tmp_path))
+
+    first = cache.lookup("a.com/robots.txt", "20220101", "20231231", None, fetch)
+    assert [s["timestamp"][:8] for s in first] == ["20220301", "20230601"]
+
+    extended = scraper.CdxIndexCache(str(tmp_path)).lookup(
+        "a.com/robots.txt", "20220101", "20241231", None, fetch)
+    assert [s["timestamp"][:8] for s in extended] == ["20220301", "20230601", "20240201"]
+    assert len(fetch.calls) == 2
+    assert fetch.calls[1][1] == "20231231235959"
+
+
+def test_cdx_cache_respects_limit_with_partial_coverage(tmp_path):
+    fetch = _FakeCdx(["20220301", "20220401", "20220501", "20220601"])
+    cache = scraper.CdxIndexCache(str(tmp_path))
+
+    assert len(cache.lookup("a.com/robots.txt", None, None, 2, fetch)) == 2
+    three = cache.lookup("a.com/robots.txt", None, None, 3, fetch)
+    assert [s["timestamp"][:8] for s in three] == ["20220301", "20220401", "20220501"]
+    assert cache.lookup("a.com/robots.txt", None, None, 3, fetch) == three
+    assert len(fetch.calls) == 2
+
+
+def test_cdx_cache_requeries_recent_part_of_window(tmp_path):
+    fetch = _FakeCdx(["20220301"])
+    cache = scraper.CdxIndexCache(str(tmp_path))
+    cache.lookup("a.com/robots.txt", "20220101", None, None, fetch)
+    cache.record("b.com/robots.txt", "20220101", None, [])
+
+    cutoff = scraper._coverage_cutoff()
+    fetch.snapshots.append({"timestamp": cutoff[:8] + "235959", "original": "a.com/robots.txt"})
+    found = cache.lookup("a.com/robots.txt", "20220101", None, None, fetch)
+    assert len(found) == 2
+    assert fetch.calls[1][1][:8] == cutoff[:8] and fetch.calls[1][2] is None
+    assert cache.peek("b.com/robots.txt", "20220101", None, None) is None
+
+    # Offline, the recent part seen by earlier queries is served as is
+    offline = scraper.CdxIndexCache(str(tmp_path), offline=True)
+    assert offline.lookup("a.com/robots.txt", "20220101", None, None, None) == found
+    assert offline.lookup("b.com/robots.txt", "20220101", None, None, None) == []
+    with pytest.raises(scraper.CdxCacheMiss):
+        offline.lookup("a.com/robots.txt", "20210101", None, None, None)
+
+
+class _StreamedResponse:
+    """Minimal streamed response serving a fixed body in small chunks."""
+
+    status_code = 200
+    headers = {}
+
+    def __init__(self, body, chunk=7):
+        self.body = body.encode("utf-8")
+        self.chunk = chunk
+
+    def iter_content(self, chunk_size=1):
+        for start in range(0, len(self.body), self.chunk):
+            yield self.body[start:start + self.chunk]
+
+    def raise_for_status(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def test_iter_json_rows_parses_rows_split_across_chunks():
+    body = '[["timestamp","original"],\n["20230101000000","http://a.com/robots.txt"],\n[],\n["key"]]\n'
+    rows = list(scraper._iter_json_rows(_StreamedResponse(body)))
+    assert rows == [["timestamp", "original"],
+                    ["20230101000000", "http://a.com/robots.txt"], [], ["key"]]
+
+
+def test_bulk_cdx_answers_related_domains_with_paged_domain_query(monkeypatch):
+    pages = [
+        '[["timestamp","original"],'
+        '["20230101000000","http://news.example.com/robots.txt"],'
+        '["20230101120000","https://news.example.com/robots.txt"],'
+        '[],["page2"]]',
+        '[["timestamp","original"],'
+        '["20230105000000","http://www.example.com:80/robots.txt"]]',
+    ]
+    calls = []
+
+    def fake_get(url, kind, session=None, params=None, **kwargs):
+        calls.append(dict(params))
+        return _StreamedResponse(pages[len(calls) - 1])
+
+    monkeypatch.setattr(scraper, "_archive_get", fake_get)
+    found = scraper.get_cdx_snapshots_bulk(["example.com", "https://news.example.com/"])
+
+    assert len(calls) == 2
+    assert calls[0]["url"] == "example.com" and calls[0]["matchType"] == "domain"
+    assert calls[1]["resumeKey"] == "page2"
+    assert [s["timestamp"] for s in found["https://news.example.com/"]] == ["20230101000000"]
+    assert [s["timestamp"] for s in found["example.com"]] == ["20230105000000"]
+
+
+def test_iter_cdx_snapshots_resumes_from_saved_page(monkeypatch, tmp_path):
+    pages = {
+        None: '[["timestamp","original"],["20230101000000","a.com/robots.txt"],[],["k2"]]',
+        "k2": '[["timestamp","original"],["20230101090000","a.com/robots.txt"],'
+              '["20230102000000","a.com/robots.txt"]]',
+    }
+    calls = []
+
+    def fake_get(url, kind, session=None, params=None, **kwargs):
+        key = params.get("resumeKey")
+        calls.append(key)
+        if key == "k2" and calls.count("k2") == 1:
+            raise scraper.ConnectionError("dropped")
+        return _StreamedResponse(pages[key])
+
+    monkeypatch.setattr(scraper, "_archive_get", fake_get)
+    state = tmp_path / "cdx_state.json"
+
+    walk = scraper.iter_cdx_snapshots("a.com/robots.txt", state_file=str(state))
+    assert next(walk)["timestamp"] == "20230101000000"
+    with pytest.raises(scraper.ConnectionError):
+        next(walk)
+    assert state.exists()
+
+    resumed = list(scraper.iter_cdx_snapshots("a.com/robots.txt", state_file=str(state)))
+    assert [s["timestamp"] for s in resumed] == ["20230101090000", "20230102000000"]
+    assert calls == [None, "k2", "k2"]
+    assert not state.exists()
+
+
+def test_nearest_captures_only_resolves_inside_known_window():
+    captures = [{"timestamp": "20230110000000"}, {"timestamp": "20230301000000"}]
+    window = ("20230101000000", "20230401000000")
+    resolved = scraper._nearest_captures(
+        ["20230108000000", "20230120000000", "20230325000000"], captures, window)
+    assert resolved == {
+        "20230108000000": "20230110000000",
+        "20230120000000": "20230110000000",
+        # A capture after the window could be closer than 20230301
+        "20230325000000": "20230325000000",
+    }
+
+
+def test_scrape_downloads_each_homepage_capture_once(monkeypatch):
+    snaps = [{"timestamp": ts, "original": "http://a.com/robots.txt"}
+             for ts in ("20230201000000", "20230202000000", "20230203000000")]
+
+    def fake_captures(url, collapse_daily=True, **kwargs):
+        assert url == "a.com" and not collapse_daily
+        return iter([{"timestamp": ts, "original": "http://a.com/"}
+                     for ts in ("20230202010000", "20230202230000")])
+
+    downloads = []
+
+    def fake_download(url, timestamp, *args, **kwargs):
+        downloads.append((url, timestamp))
+        return _response(b"<html><head><meta name='robots' content='noindex'></head></html>")
+
+    monkeypatch.setattr(scraper, "get_cdx_snapshots", lambda url, **kwargs: snaps)
+    monkeypatch.setattr(scraper, "iter_cdx_snapshots", fake_captures)
+    monkeypatch.setattr(scraper, "download_wayback", fake_download)
+    monkeypatch.setattr(scraper, "download_wayback_head", fake_download)
+
+    df = scraper.scrape_robots_and_signals("a.com")
+    home = [d for d in downloads if d[0] == "http://a.com"]
+    assert home == [("http://a.com", "20230202010000"), ("http://a.com", "20230202230000")]
+    assert list(df["meta_robots"]) == ["noindex"] * 3
+
+    # A single snapshot has nothing to share, so no capture lookup is made
+    monkeypatch.setattr(scraper, "get_cdx_snapshots", lambda url, **kwargs: snaps[:1])
+    monkeypatch.setattr(scraper, "iter_cdx_snapshots", None)
+    scraper.scrape_robots_and_signals("a.com")
+
+
+def test_homepage_captures_are_cached_and_resolved_offline(monkeypatch, tmp_path):
+    timestamps = ["20230201000000", "20230203000000"]
+    calls = []
+
+    def fake_captures(url, collapse_daily=True, **kwargs):
+        calls.append(url)
+        return iter([{"timestamp": "20230202120000", "original": "http://a.com/"}])
+
+    monkeypatch.setattr(scraper, "iter_cdx_snapshots", fake_captures)
+    monkeypatch.setattr(scraper, "_cdx_cache", scraper.CdxIndexCache(str(tmp_path)))
+    online = scraper.resolve_homepage_captures("a.com", timestamps)
+    assert online == {ts: "20230202120000" for ts in timestamps}
+    assert scraper.resolve_homepage_captures("a.com", timestamps) == online
+    assert calls == ["a.com"]
+
+    monkeypatch.setattr(scraper, "iter_cdx_snapshots", None)
+    offline = scraper.CdxIndexCache(str(tmp_path), offline=True)
+    monkeypatch.setattr(scraper, "_cdx_cache", offline)
+    assert scraper.resolve_homepage_captures("a.com", timestamps) == online
+    # Every-capture answers do not stand in for daily-collapsed queries
+    with pytest.raises(scraper.CdxCacheMiss):
+        offline.lookup("a.com", "20230101", "20230301", None, None)
+
+
+def test_changes_only_downloads_one_robots_body_per_digest(monkeypatch):
+    snaps = [{"timestamp": ts, "original": "http://a.com/robots.txt", "digest": d}
+             for ts, d in (("20230201000000", "D1"), ("20230202000000", "D1"),
+                           ("20230203000000", "D2"))]
+    downloads = []
+
+    def fake_download(url, timestamp, *args, **kwargs):
+        downloads.append((url, timestamp))
+        return _response(f"User-agent: *\nDisallow: /{timestamp}".encode())
+
+    monkeypatch.setattr(scraper, "get_cdx_snapshots", lambda url, **kwargs: [])
+    monkeypatch.setattr(scraper, "download_wayback", fake_download)
+    monkeypatch.setattr(scraper, "download_wayback_head", fake_download)
+
+    df = scraper.scrape_robots_and_signals("a.com", snapshots=snaps, changes_only=True)
+    robots = [ts for url, ts in downloads if url.endswith("robots.txt")]
+    assert robots == ["20230201000000", "20230203000000"]
+    assert list(df["timestamp"]) == [s["timestamp"] for s in snaps]
+    assert df["robots_txt"][1] == df["robots_txt"][0]
+
+
+def test_download_wayback_head_stops_after_head(monkeypatch):
+    body = "<html><HEAD><meta name='robots' content='noai'></HEAD>" + "x" * 100000
+    streamed = _StreamedResponse(body, chunk=16)
+    streamed.url = "https://web.archive.org/web/1id_/http://a.com"
+    streamed.encoding = "utf-8"
+    reads = []
+    original_iter = streamed.iter_content
+
+    def counting_iter(chunk_size=1):
+        for chunk in original_iter(chunk_size):
+            reads.append(len(chunk))
+            yield chunk
+
+    streamed.iter_content = counting_iter
+    monkeypatch.setattr(scraper, "_archive_get", lambda *args, **kwargs: streamed)
+
+    resp = scraper.download_wayback_head("http://a.com", "20230101000000")
+    assert sum(reads) < 100
+    assert scraper.extract_meta_robots(resp._content.decode()) == "noai"
+
+
+def test_download_wayback_headers_falls_back_when_head_is_refused(monkeypatch):
+    methods = []
+
+    def fake_get(url, kind, session=None, method="GET", **kwargs):
+        methods.append(method)
+        return _response(b"<html>big body</html>", status=405 if method == "HEAD" else 200)
+
+    monkeypatch.setattr(scraper, "_archive_get", fake_get)
+    resp = scraper.download_wayback_headers("http://a.com", "20230101000000")
+
+    assert methods == ["HEAD", "GET"]
+    assert resp.status_code == 200 and resp.content == b""
+    row = {}
+    scraper._fill_home_fields(row, resp, meta=False)
+    assert row == {"status_home": 200, "x_robots_tag": "noai"}
+
+
+def test_offline_headers_fetch_uses_cached_error_response(monkeypatch, tmp_path):
+    cache = scraper.SnapshotCache(str(tmp_path), offline=True)
+    archive_url = "https://web.archive.org/web/20230101000000id_/http://a.com"
+    cache.put(archive_url + "#head", _response(b"", status=404))
+    monkeypatch.setattr(scraper, "_snapshot_cache", cache)
+
+    assert scraper.download_wayback_headers("http://a.com", "20230101000000").status_code == 404
+    assert scraper.download_wayback_head("http://a.com", "20230101000000").status_code == 404
+
+
+def test_robots_only_signals_skip_homepage_fetches(monkeypatch):
+    snaps = [{"timestamp": "20230201000000", "original": "http://a.com/robots.txt"}]
+    downloads = []
+
+    def fake_download(url, timestamp, *args, **kwargs):
+        downloads.append(url)
+        return _response(b"User-agent: *\nDisallow: /")
+
+    def fail_cdx(url, **kwargs):
+        raise AssertionError("no homepage capture lookup expected")
+
+    monkeypatch.setattr(scraper, "get_cdx_snapshots", fail_cdx)
+    monkeypatch.setattr(scraper, "download_wayback", fake_download)
+    monkeypatch.setattr(scraper, "download_homepage", fake_download)
+
+    df = scraper.scrape_robots_and_signals("a.com", snapshots=snaps, signals={"robots"})
+    assert downloads == ["http://a.com/robots.txt"]
+    assert df["robots_content_type"][0] == "robots.txt"
+    assert df["status_home"].isna().all() and df["x_robots_tag"].isna().all()
+
+    downloads.clear()
+    monkeypatch.setattr(scraper, "get_cdx_snapshots", lambda url, **kwargs: snaps)
+    df = asyncio.run(scraper.async_scrape_robots_and_signals(
+        "a.com", signals={"xrobots"}, resolve_homepages=False))
+    assert downloads == ["http://a.com"]
+    assert df["robots_content_type"].isna().all()
+    assert df["x_robots_tag"][0] == "noai" and df["meta_robots"].isna().all()
+
+
+def test_shard_of_is_stable_and_ignores_scheme():
+    shards = {scraper.shard_of(d, 4) for d in ("https://a.com/", "A.com", "a.com")}
+    assert len(shards) == 1
+    spread = {scraper.shard_of(f"site{i}.com", 4) for i in range(100)}
+    assert spread == {0, 1, 2, 3}
+
+
+def test_merge_shard_outputs_validates_and_concatenates(tmp_path):
+    def part(shard, timestamp):
+        rows = [{column: None for column in ROBOTS_SCRAPE_SCHEMA} for _ in range(2)]
+        rows[0].update(domain=f"d{shard}.com", timestamp=timestamp, status_robots=200,
+                       robots_txt="NA")
+        rows[1].update(domain=f"d{shard}.com", timestamp=timestamp)
+        path = scraper.shard_paths(str(tmp_path), shard, 3)["output_csv"]
+        pd.DataFrame(rows, dtype=object).to_csv(path, index=False)
+
+    part(0, "20230101000000")
+    part(2, "20230102000000")
+    merged = tmp_path / "merged.csv"
+    scraper.merge_shard_outputs(str(tmp_path), str(merged), 3)
+    df = pd.read_csv(merged, dtype=str, keep_default_na=False)
+    assert list(df["domain"]) == ["d0.com", "d0.com", "d2.com", "d2.com"]
+    assert list(df["status_robots"]) == ["200", "", "200", ""]
+    assert list(df["robots_txt"]) == ["NA", "", "NA", ""]
+
+    part(1, "2023")
+    with pytest.raises(ValueError, match="14 digits"):
+        scraper.merge_shard_outputs(str(tmp_path), str(tmp_path / "bad.csv"), 3)
+    assert not (tmp_path / "bad.csv").exists()
+
+
+def test_progress_journal_reloads_and_ignores_torn_line(tmp_path):
+    path = tmp_path / "progress.log"
+    journal = scraper.SnapshotProgressJournal(str(path))
+    journal.record("a.com", "20230101000000")
+    journal.close()
+    with open(path, "a") as f:
+        f.write("a.com\t2023")
+
+    reloaded = scraper.SnapshotProgressJournal(str(path))
+    assert reloaded.done("a.com") == {"20230101000000"}
+    reloaded.record("a.com", "20230102000000")
+    reloaded.close()
+    assert scraper.SnapshotProgressJournal(str(path)).done("a.com") == {
+        "20230101000000", "20230102000000"}
+
+
+def test_batch_resume_skips_journaled_snapshots(monkeypatch, tmp_path):
+    snaps = [{"timestamp": ts, "original": "http://a.com/robots.txt"}
+             for ts in ("20230101000000", "20230102000000")]
+    downloads = []
+
+    def fake_download(url, timestamp, *args, **kwargs):
+        downloads.append(timestamp)
+        return _response(b"User-agent: *")
+
+    monkeypatch.setattr(scraper, "_lookup_cdx_snapshots", lambda url, **kwargs: snaps)
+    monkeypatch.setattr(scraper, "download_wayback", fake_download)
+
+    pd.DataFrame({"domain": ["a.com"]}).to_csv(tmp_path / "in.csv", index=False)
+    journal = scraper.SnapshotProgressJournal(str(tmp_path / "progress.log"))
+    journal.record("a.com", "20230101000000")
+    journal.close()
+
+    scraper.batch_scrape_domains(
+        str(tmp_path / "in.csv"), str(tmp_path / "out.csv"),
+        checkpoint_file=str(tmp_path / "ckpt.txt"),
+        error_log_file=str(tmp_path / "errors.txt"),
+        retry_queue_file=str(tmp_path / "retry.jsonl"),
+        progress_journal_file=str(tmp_path / "progress.log"),
+        signals={"robots"}
+    )
+    assert downloads == ["20230102000000"]
+    assert list(pd.read_csv(tmp_path / "out.csv", dtype=str)["timestamp"]) == ["20230102000000"]
+
+
+def test_domain_checkpoint_resumes_by_identity_after_list_grows(monkeypatch, tmp_path):
+    scraped = []
+
+    def fake_scrape(domain, **kwargs):
+        scraped.append(domain)
+        return pd.DataFrame()
+
+    monkeypatch.setattr(scraper, "scrape_robots_and_signals", fake_scrape)
+    monkeypatch.setattr(scraper, "_lookup_cdx_snapshots", lambda url, **kwargs: [])
+    paths = dict(checkpoint_file=str(tmp_path / "ckpt.txt"),
+                 error_log_file=str(tmp_path / "errors.txt"),
+                 retry_queue_file=str(tmp_path / "retry.jsonl"),
+                 progress_journal_file=str(tmp_path / "progress.log"))
+
+    pd.DataFrame({"domain": ["a.com", "b.com"]}).to_csv(tmp_path / "in.csv", index=False)
+    scraper.batch_scrape_domains(str(tmp_path / "in.csv"), str(tmp_path / "out.csv"), **paths)
+
+    pd.DataFrame({"domain": ["c.com", "https://B.com/", "a.com"]}).to_csv(
+        tmp_path / "in.csv", index=False)
+    scraper.batch_scrape_domains(str(tmp_path / "in.csv"), str(tmp_path / "out.csv"), **paths)
+
+    assert scraped == ["a.com", "b.com", "c.com"]
+
+
+def test_checkpoint_skips_failed_cdx_lookups_and_other_windows(monkeypatch, tmp_path):
+    lookups = []
+
+    def fake_lookup(url, **kwargs):
+        lookups.append((url, kwargs["to_timestamp"]))
+        if url.startswith("b.com"):
+            raise scraper.CdxCacheMiss(url)
+        return []
+
+    monkeypatch.setattr(scraper, "_lookup_cdx_snapshots", fake_lookup)
+    paths = dict(checkpoint_file=str(tmp_path / "ckpt.txt"),
+                 error_log_file=str(tmp_path / "errors.txt"),
+                 retry_queue_file=str(tmp_path / "retry.jsonl"),
+                 progress_journal_file=str(tmp_path / "progress.log"))
+    pd.DataFrame({"domain": ["a.com", "b.com"]}).to_csv(tmp_path / "in.csv", index=False)
+
+    for to_timestamp in ("20230101", "20230101", "20240101"):
+        scraper.batch_scrape_domains(str(tmp_path / "in.csv"), str(tmp_path / "out.csv"),
+                                     to_timestamp=to_timestamp, **paths)
+
+    assert lookups == [("a.com/robots.txt", "20230101"), ("b.com/robots.txt", "20230101"),
+                       ("b.com/robots.txt", "20230101"),
+                       ("a.com/robots.txt", "20240101"), ("b.com/robots.txt", "20240101")]
+
+
+def test_bulk_cdx_leaves_failed_lookups_out_of_checkpoint(monkeypatch, tmp_path):
+    def fake_lookup(url, **kwargs):
+        if url.startswith("example.com"):
+            raise scraper.Timeout(url)
+        return []
+
+    monkeypatch.setattr(scraper, "_lookup_cdx_snapshots", fake_lookup)
+    assert scraper.get_cdx_snapshots_bulk(["example.com", "other.org"]) == {"other.org": []}
+
+    pd.DataFrame({"domain": ["example.com", "other.org"]}).to_csv(tmp_path / "in.csv",
+                                                                  index=False)
+    scraper.batch_scrape_domains(str(tmp_path / "in.csv"), str(tmp_path / "out.csv"),
+                                 checkpoint_file=str(tmp_path / "ckpt.txt"),
+                                 error_log_file=str(tmp_path / "errors.txt"),
+                                 retry_queue_file=str(tmp_path / "retry.jsonl"),
+                                 progress_journal_file=str(tmp_path / "progress.log"),
+                                 bulk_cdx=True)
+    checkpointed = [line for line in (tmp_path / "ckpt.txt").read_text().splitlines()
+                    if not line.startswith("#run")]
+    assert checkpointed == ["other.org"]
+    assert "example.com" in (tmp_path / "errors.txt").read_text()
+
+
+def test_build_work_list_normalizes_dedupes_and_filters():
+    raw = pd.Series([" HTTPS://A.com/ ", "a.com", None, "", "not a domain",
+                     "b.com/fr", "done.com", "http://c.org"])
+    work = scraper.build_work_list(raw, done={"done.com"})
+    assert work == [(0, "a.com"), (5, "b.com/fr"), (7, "c.org")]
+    assert all(scraper._normalize_domain(raw[i]) == d for i, d in work)
+
+
+def test_parquet_output_writes_row_group_parts(monkeypatch, tmp_path):
+    pytest.importorskip("pyarrow")
+
+    snaps = [{"timestamp": f"2023010{day}000000", "original": "http://a.com/robots.txt"}
+             for day in (1, 2, 3)]
+    monkeypatch.setattr(scraper, "_lookup_cdx_snapshots", lambda url, **kwargs: snaps)
+    monkeypatch.setattr(scraper, "download_wayback",
+                        lambda *args, **kwargs: _response(b"User-agent: *"))
+
+    pd.DataFrame({"domain": ["a.com"]}).to_csv(tmp_path / "in.csv", index=False)
+    scraper.batch_scrape_domains(
+        str(tmp_path / "in.csv"), str(tmp_path / "out"),
+        checkpoint_file=str(tmp_path / "ckpt.txt"),
+        error_log_file=str(tmp_path / "errors.txt"),
+        retry_queue_file=str(tmp_path / "retry.jsonl"),
+        progress_journal_file=str(tmp_path / "progress.log"),
+        signals={"robots"}, output_format="parquet", flush_rows=2
+    )
+
+    assert sorted(p.name for p in (tmp_path / "out").iterdir()) == [
+        "part-000000.parquet", "part-000001.parquet"]
+    df = pd.read_parquet(tmp_path / "out", columns=["domain", "timestamp", "status_robots"])
+    assert list(df.columns) == ["domain", "timestamp", "status_robots"]
+    assert sorted(df["timestamp"]) == [s["timestamp"] for s in snaps]
+    assert list(df["status_robots"]) == [200, 200, 200]
+    assert "a.com" in (tmp_path / "ckpt.txt").read_text().splitlines()
+
+
+def test_robots_blob_store_keeps_one_body_per_hash(monkeypatch, tmp_path):
+    snaps = [{"timestamp": f"2023010{day}000000", "original": "http://a.com/robots.txt"}
+             for day in (1, 2, 3)]
+    monkeypatch.setattr(scraper, "_lookup_cdx_snapshots", lambda url, **kwargs: snaps)
+    monkeypatch.setattr(scraper, "download_wayback",
+                        lambda *args, **kwargs: _response(b"User-agent: *\nDisallow: /x"))
+
+    pd.DataFrame({"domain": ["a.com"]}).to_csv(tmp_path / "in.csv", index=False)
+    scraper.batch_scrape_domains(
+        str(tmp_path / "in.csv"), str(tmp_path / "out.csv"),
+        checkpoint_file=str(tmp_path / "ckpt.txt"),
+        error_log_file=str(tmp_path / "errors.txt"),
+        retry_queue_file=str(tmp_path / "retry.jsonl"),
+        progress_journal_file=str(tmp_path / "progress.log"),
+        signals={"robots"}, robots_blob_dir=str(tmp_path / "blobs")
+    )
+
+    df = pd.read_csv(tmp_path / "out.csv", dtype=str)
+    assert df["raw_robots_response_text"].isna().all()
+    assert df["robots_hash"].nunique() == 1
+    assert len(list((tmp_path / "blobs").rglob("*.txt.gz"))) == 1
+
+    restored = scraper.restore_robots_bodies(df, str(tmp_path / "blobs"))
+    assert list(restored["robots_txt"]) == ["User-agent: *\nDisallow: /x"] * 3
+
+
+def test_response_archive_reads_back_single_records(monkeypatch, tmp_path):
+    monkeypatch.setattr(scraper, "get_cdx_snapshots", lambda url, **kwargs: [
+        {"timestamp": "20230101000000", "original": "http://a.com/robots.txt"}])
+    monkeypatch.setattr(scraper, "download_wayback",
+                        lambda *args, **kwargs: _response(b"User-agent: *\r\nDisallow: /"))
+    monkeypatch.setattr(scraper, "download_wayback_head",
+                        lambda *args, **kwargs: _response(b"<html><head></head>"))
+
+    path = str(tmp_path / "responses.warc.gz")
+    archive = scraper.ResponseArchive(path)
+    scraper.scrape_robots_and_signals("a.com", resolve_homepages=False,
+                                      response_archive=archive)
+    archive.close()
+
+    with open(path, "ab") as f:
+        f.write(b"\x1f\x8b torn record")
+    archive = scraper.ResponseArchive(path)
+    assert len(archive) == 2
+    robots = archive.get("http://a.com/robots.txt", "20230101000000")
+    assert robots.status_code == 200
+    assert robots.content == b"User-agent: *\r\nDisallow: /"
+    assert archive.get("http://a.com", "20230101000000").content == b"<html><head></head>"
+    archive.close()
+    with open(path, "rb") as f:
+        assert not f.read().endswith(b"torn record")
+
+
+def test_response_archive_record_ids_are_unique(tmp_path):
+    path = str(tmp_path / "responses.warc.gz")
+    archive = scraper.ResponseArchive(path)
+    for _ in range(2):
+        archive.write("http://a.com/robots.txt", "20230101000000",
+                      _response(b"User-agent: *"))
+    archive.close()
+
+    with gzip.open(path, "rb") as f:
+        ids = re.findall(rb"WARC-Record-ID: <(urn:uuid:[0-9a-f-]{36})>", f.read())
+    assert len(ids) == 2 and ids[0] != ids[1]
+
+
+def test_sqlite_output_upserts_and_finds_latest_capture(tmp_path):
+    def rows(*timestamps, text="User-agent: *"):
+        return pd.DataFrame([{**{column: None for column in scraper.ROBOTS_SCRAPE_SCHEMA
+                                 if column != "datetime"},
+                              "domain": "a.com", "timestamp": ts, "robots_txt": text,
+                              "robots_content_type": "robots.txt", "status_robots": 200}
+                             for ts in timestamps])
+
+    path = str(tmp_path / "robots.db")
+    output = scraper.SqliteOutput(path, batch_rows=2)
+    output.write(rows("20230101000000", "20230301000000"))
+    output.flush()
+    output.write(rows("20230301000000", text="Disallow: /"))
+    output.close()
+
+    latest = scraper.latest_robots_before(path, "https://A.com/", "2023-06-01")
+    assert latest["timestamp"] == "20230301000000"
+    assert latest["robots_txt"] == "Disallow: /"
+    assert latest["status_robots"] == 200
+    assert scraper.latest_robots_before(path, "a.com", "2023-01-01") is None
+
+    conn = sqlite3.connect(path)
+    assert conn.execute("SELECT COUNT(*) FROM robots").fetchone() == (2,)
+    assert conn.execute("PRAGMA journal_mode").fetchone() == ("wal",)
+    conn.close()
+
+
+def test_buffered_csv_commits_journal_and_checkpoint_with_flush(tmp_path):
+    output = scraper.CsvOutput(str(tmp_path / "out.csv"), flush_rows=2)
+    journal = scraper.SnapshotProgressJournal(str(tmp_path / "progress.log"))
+    checkpoint = scraper.DomainCheckpoint(str(tmp_path / "ckpt.txt"))
+    queue = scraper.SnapshotRetryQueue(str(tmp_path / "retry.jsonl"))
+    sink = scraper._SnapshotRowSink(output, journal, checkpoint, queue,
+                                    dict(snapshots=0), flush_interval=3600)
+
+    def row(ts):
+        return {**scraper._new_snapshot_row("a.com", {"timestamp": ts, "original": "u"}),
+                "status_robots": 200}
+
+    sink(row("20230101000000"))
+    sink.finish_domain("a.com")
+    assert (tmp_path / "out.csv").read_text() == ""
+    assert not journal.done("a.com") and "a.com" not in checkpoint
+
+    sink(row("20230102000000"))
+    assert len(pd.read_csv(tmp_path / "out.csv")) == 2
+    assert len(journal.done("a.com")) == 2 and "a.com" in checkpoint
+
+    sink(row("20230103000000"))
+    sink.close()
+    journal.close()
+    checkpoint.close()
+    assert len(pd.read_csv(tmp_path / "out.csv")) == 3
+    assert len(scraper.SnapshotProgressJournal(str(tmp_path / "progress.log"))) == 3
+
+
+def test_resume_rolls_back_rows_written_after_last_commit(monkeypatch, tmp_path):
+    snaps = [{"timestamp": ts, "original": "http://a.com/robots.txt"}
+             for ts in ("20230101000000", "20230102000000")]
+    downloads = []
+
+    def fake_download(url, timestamp, *args, **kwargs):
+        downloads.append(timestamp)
+        return _response(b"User-agent: *")
+
+    monkeypatch.setattr(scraper, "_lookup_cdx_snapshots", lambda url, **kwargs: snaps)
+    monkeypatch.setattr(scraper, "download_wayback", fake_download)
+    paths = dict(checkpoint_file=str(tmp_path / "ckpt.txt"),
+                 error_log_file=str(tmp_path / "errors.txt"),
+                 retry_queue_file=str(tmp_path / "retry.jsonl"),
+                 progress_journal_file=str(tmp_path / "progress.log"))
+
+    # A run that flushed both rows but crashed before committing the second
+    output = scraper.CsvOutput(str(tmp_path / "out.csv"), flush_rows=1)
+    journal = scraper.SnapshotProgressJournal(paths["progress_journal_file"])
+    for snap in snaps:
+        output.write(pd.DataFrame([scraper._new_snapshot_row("a.com", snap)]))
+        output.flush()
+        if snap is snaps[0]:
+            journal.record_many([("a.com", snap["timestamp"])],
+                                output_state=output.commit_state())
+    output.close()
+    journal._file.write("a.com\t20230102000000\n")
+    journal.close()
+
+    pd.DataFrame({"domain": ["a.com"]}).to_csv(tmp_path / "in.csv", index=False)
+    scraper.batch_scrape_domains(str(tmp_path / "in.csv"), str(tmp_path / "out.csv"),
+                                 signals={"robots"}, **paths)
+
+    assert downloads == ["20230102000000"]
+    out = pd.read_csv(tmp_path / "out.csv", dtype=str)
+    assert list(out["timestamp"]) == [s["timestamp"] for s in snaps]
+
+
+def test_batch_restores_caches_after_offline_run(monkeypatch, tmp_path):
+    monkeypatch.setattr(scraper, "_snapshot_cache", None)
+    monkeypatch.setattr(scraper, "_cdx_cache", None)
+    pd.DataFrame({"domain": ["a.com"]}).to_csv(tmp_path / "in.csv", index=False)
+    scraper.batch_scrape_domains(
+        str(tmp_path / "in.csv"), str(tmp_path / "out.csv"),
+        checkpoint_file=str(tmp_path / "ckpt.txt"),
+        error_log_file=str(tmp_path / "errors.txt"),
+        retry_queue_file=str(tmp_path / "retry.jsonl"),
+        progress_journal_file=str(tmp_path / "progress.log"),
+        cache_dir=str(tmp_path / "cache"), cdx_cache_dir=str(tmp_path / "cdx"),
+        offline=True
+    )
+
+    assert scraper._snapshot_cache is None and scraper._cdx_cache is None
+    assert "a.com" not in (tmp_path / "ckpt.txt").read_text().splitlines()
+
+
+def test_sink_without_flush_interval_flushes_by_size_only(monkeypatch, tmp_path):
+    clock = [0.0]
+    monkeypatch.setattr(scraper.time, "monotonic", lambda: clock[0])
+    output = scraper.CsvOutput(str(tmp_path / "out.csv"), flush_rows=2)
+    sink = scraper._SnapshotRowSink(
+        output, scraper.SnapshotProgressJournal(str(tmp_path / "progress.log")),
+        scraper.DomainCheckpoint(str(tmp_path / "ckpt.txt")),
+        scraper.SnapshotRetryQueue(str(tmp_path / "retry.jsonl")), dict(snapshots=0))
+
+    sink(scraper._new_snapshot_row("a.com", {"timestamp": "20230101000000", "original": "u"}))
+    clock[0] = 3600.0
+    sink.finish_domain("a.com")
+    assert output.pending_rows == 1
+    assert scraper.DEFAULT_FLUSH_INTERVALS["parquet"] is None
+
+
+def test_concurrent_batch_writes_each_row_once(monkeypatch, tmp_path, capsys):
+    domains = [f"site{i}.com" for i in range(8)] + ["empty.com", "broken.com"]
+
+    def fake_lookup(url, **kwargs):
+        domain = url.split("/")[0]
+        if domain == "broken.com":
+            raise scraper.Timeout(url)
+        if domain == "empty.com":
+            return []
+        return [{"timestamp": f"2023010{day}000000", "original": f"http://{url}"}
+                for day in (1, 2, 3)]
+
+    monkeypatch.setattr(scraper, "_lookup_cdx_snapshots", fake_lookup)
+    monkeypatch.setattr(scraper, "download_wayback",
+                        lambda *args, **kwargs: _response(b"User-agent: *"))
+
+    pd.DataFrame({"domain": domains}).to_csv(tmp_path / "in.csv", index=False)
+    scraper.batch_scrape_domains(
+        str(tmp_path / "in.csv"), str(tmp_path / "out.csv"),
+        checkpoint_file=str(tmp_path / "ckpt.txt"),
+        error_log_file=str(tmp_path / "errors.txt"),
+        retry_queue_file=str(tmp_path / "retry.jsonl"),
+        progress_journal_file=str(tmp_path / "progress.log"),
+        signals={"robots"}, max_workers=4, flush_rows=5
+    )
+
+    out = pd.read_csv(tmp_path / "out.csv", dtype=str)
+    assert len(out) == 24
+    assert not out.duplicated(["domain", "timestamp"]).any()
+    assert set(out["domain"]) == set(domains[:8])
+
+    checkpointed = {line for line in (tmp_path / "ckpt.txt").read_text().splitlines()
+                    if not line.startswith("#run")}
+    assert checkpointed == set(domains[:9])
+    summary = capsys.readouterr().out
+    assert "Successful: 8, Failed: 2" in summary
+    assert "Total snapshots: 24" in summary
+
+
+def test_async_wrappers_forward_to_sync_functions(monkeypatch):
+    snaps = [{"timestamp": "20230101000000", "original": "http://a.com/robots.txt"}]
+    calls = []
+
+    def fake_cdx(url, **kwargs):
+        calls.append(("cdx", url, kwargs["limit"], kwargs["session"] is not None))
+        return snaps
+
+    def fake_download(url, timestamp, **kwargs):
+        calls.append(("download", url, timestamp, kwargs["session"] is not None))
+        return _response(b"User-agent: *")
+
+    monkeypatch.setattr(scraper, "get_cdx_snapshots", fake_cdx)
+    monkeypatch.setattr(scraper, "download_wayback", fake_download)
+
+    async def run():
+        found = await scraper.async_get_cdx_snapshots("a.com/robots.txt", limit=5)
+        async with scraper.AsyncWaybackClient(max_connections=2) as client:
+            resp = await scraper.async_download_wayback(
+                "http://a.com/robots.txt", "20230101000000", client=client)
+        return found, resp
+
+    found, resp = asyncio.run(run())
+    assert found == snaps and resp.content == b"User-agent: *"
+    assert calls == [("cdx", "a.com/robots.txt", 5, True),
+                     ("download", "http://a.com/robots.txt", "20230101000000", True)]
+
+    # Calls without a client share one pool and session across event loops
+    sessions = []
+    monkeypatch.setattr(scraper, "get_cdx_snapshots",
+                        lambda url, **kwargs: sessions.append(kwargs["session"]) or snaps)
+    for _ in range(2):
+        asyncio.run(scraper.async_get_cdx_snapshots("a.com/robots.txt"))
+    assert sessions[0] is sessions[1] is scraper.get_shared_async_client().session
+
+
+def test_async_scrape_shares_homepage_and_digest_downloads(monkeypatch):
+    snaps = [{"timestamp": f"2023010{day}000000", "original": "http://a.com/robots.txt",
+              "digest": "SAME" if day < 3 else "NEW"} for day in (1, 2, 3)]
+    lock = threading.Lock()
+    robots_fetches, home_fetches = [], []
+
+    def fake_robots(url, timestamp, **kwargs):
+        with lock:
+            robots_fetches.append(timestamp)
+        return _response(b"User-agent: *")
+
+    def fake_home(url, timestamp, **kwargs):
+        with lock:
+            home_fetches.append(timestamp)
+        return _response(b"<html></html>")
+
+    monkeypatch.setattr(scraper, "get_cdx_snapshots", lambda url, **kwargs: snaps)
+    monkeypatch.setattr(scraper, "download_wayback", fake_robots)
+    monkeypatch.setattr(scraper, "download_homepage", fake_home)
+    monkeypatch.setattr(scraper, "resolve_homepage_captures",
+                        lambda domain, timestamps, **kwargs:
+                        {ts: "20230101120000" for ts in timestamps})
+
+    df = asyncio.run(scraper.async_scrape_robots_and_signals("a.com", changes_only=True))
+    assert len(df) == 3 and df["error_details"].isna().all()
+    assert home_fetches == ["20230101120000"]
+    assert sorted(robots_fetches) == ["20230101000000", "20230103000000"]
+    assert (df["robots_content_type"] == "robots.txt").all()
+
+
+def test_async_scrape_writes_response_archive(monkeypatch, tmp_path):
+    snaps = [{"timestamp": ts, "original": "http://a.com/robots.txt"}
+             for ts in ("20230101000000", "20230102000000")]
+    monkeypatch.setattr(scraper, "get_cdx_snapshots", lambda url, **kwargs: snaps)
+    monkeypatch.setattr(scraper, "download_wayback",
+                        lambda *args, **kwargs: _response(b"User-agent: *"))
+    monkeypatch.setattr(scraper, "download_homepage",
+                        lambda *args, **kwargs: _response(b"<html><head></head>"))
+    monkeypatch.setattr(scraper, "resolve_homepage_captures",
+                        lambda domain, timestamps, **kwargs:
+                        {ts: "20230101120000" for ts in timestamps})
+
+    archive = scraper.ResponseArchive(str(tmp_path / "responses.warc.gz"))
+    asyncio.run(scraper.async_scrape_robots_and_signals("a.com", response_archive=archive))
+    assert len(archive) == 3
+    assert archive.get("http://a.com", "20230101120000").content == b"<html><head></head>"
+    assert archive.get("http://a.com/robots.txt", "20230102000000").status_code == 200
+    archive.close()
+
+
+def test_sharded_scrape_rejects_non_csv_output(tmp_path):
+    for output_format in ("parquet", "sqlite"):
+        with pytest.raises(ValueError, match="CSV parts only"):
+            scraper.run_sharded_scrape(str(tmp_path / "in.csv"), str(tmp_path / "shards"),
+                                       num_shards=2, output_format=output_format)
+    assert not (tmp_path / "shards").exists()
+
+
+def test_csv_output_refuses_file_with_other_header(tmp_path, capsys):
+    old = tmp_path / "old.csv"
+    columns = [c for c in scraper.ROBOTS_SCRAPE_SCHEMA if c != "robots_hash"]
+    old.write_text(",".join(columns) + "\n")
+    with pytest.raises(ValueError, match="ROBOTS_SCRAPE_SCHEMA"):
+        scraper.CsvOutput(str(old))
+
+    current = tmp_path / "current.csv"
+    current.write_text(",".join(scraper.ROBOTS_SCRAPE_SCHEMA) + "\n")
+    scraper.CsvOutput(str(current)).close()
+
+    pd.DataFrame({"domain": ["a.com"]}).to_csv(tmp_path / "in.csv", index=False)
+    scraper.batch_scrape_domains(str(tmp_path / "in.csv"), str(old),
+                                 checkpoint_file=str(tmp_path / "ckpt.txt"))
+    assert "ERROR:" in capsys.readouterr().out
+    assert old.read_text() == ",".join(columns) + "\n"